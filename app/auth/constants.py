@@ -1,18 +1,31 @@
-import os
+from functools import lru_cache
 
-from dotenv import load_dotenv
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 
-load_dotenv()
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-
-if not all((SECRET_KEY, ALGORITHM)):
-    raise Exception(
-        f"SET ALL .env variables: {SECRET_KEY=}, {ALGORITHM=}"
-    )
+from app.config import get_settings
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+
+@lru_cache
+def get_pwd_context() -> CryptContext:
+    """Создает контекст хеширования паролей при первом обращении.
+
+    Returns:
+        CryptContext: Контекст bcrypt.
+    """
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def get_jwt_params() -> tuple[str, str]:
+    """Возвращает секретный ключ и алгоритм подписи JWT.
+
+    Returns:
+        tuple[str, str]: SECRET_KEY и ALGORITHM.
+
+    Raises:
+        Exception: Если переменные окружения не заданы.
+    """
+    settings = get_settings()
+    settings.require("secret_key", "algorithm")
+    return settings.secret_key, settings.algorithm
@@ -4,6 +4,17 @@ from app.database import get_user_by_username
 from .constants import oauth2_scheme
 from .services import decode_token
 
+def get_current_username(token: str = Depends(oauth2_scheme)) -> str:
+    """Получает имя текущего пользователя из токена без запроса к базе данных.
+
+    Args:
+        token (str): Токен доступа для аутентификации пользователя.
+
+    Returns:
+        str: Имя пользователя.
+    """
+    return decode_token(token)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Получает текущего пользователя на основе токена.
 
@@ -21,3 +32,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
+
+async def get_current_user_id(token: str = Depends(oauth2_scheme)):
+    """Получает идентификатор текущего пользователя, не загружая его группы и задачи.
+
+    Args:
+        token (str): Токен доступа для аутентификации пользователя.
+
+    Returns:
+        ObjectId: Идентификатор пользователя.
+
+    Raises:
+        HTTPException: Если пользователь не найден.
+    """
+    username = decode_token(token)
+    user = await get_user_by_username(username, {"_id": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user["_id"]
@@ -8,12 +8,13 @@ from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import EmailStr
 
-from app.database import get_user_by_username, get_user_by_email, add_user, activate_user, update_password
+from app.database import get_user_by_username, get_user_by_email, add_user, activate_user, set_confirm_jti, \
+    set_reset_jti, update_password
 from app.email import send_update_password_email, send_confirmation_email
 from app.models import Token
 from .constants import ACCESS_TOKEN_EXPIRE_MINUTES
-from .services import decode_token, authenticate_user, verify_password, create_access_token, create_confirmation_token, \
-    get_password_hash, verify_password_reset_token, create_password_reset_token
+from .services import authenticate_user, verify_password, create_access_token, create_confirmation_token, \
+    get_password_hash, verify_password_reset_token, create_password_reset_token, verify_confirmation_token, new_jti
 
 auth_router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -39,15 +40,16 @@ async def register(request: Request, username: str, email: EmailStr, password: s
         raise HTTPException(status_code=400, detail="Email already registered")
 
     hashed_password = get_password_hash(password)
-    await add_user(username, email, hashed_password)
-    confirmation_token = create_confirmation_token(email)
+    jti = new_jti()
+    await add_user(username, email, hashed_password, jti)
+    confirmation_token = create_confirmation_token(email, jti)
     send_confirmation_email(email, f"{request.base_url}auth/confirm?token={confirmation_token}")
 
     return {"message": "User registered. Please check your email to confirm your account."}
 
 @auth_router.get("/confirm")
 async def confirm_email(token: str):
-    """Подтверждает электронную почту во время регистрации.
+    """Подтверждает электронную почту во время регистрации. Токен можно использовать один раз.
 
     Args:
         token (str): Токен подтверждения.
@@ -56,17 +58,36 @@ async def confirm_email(token: str):
         dict: Сообщение об успешном подтверждении.
 
     Raises:
-        HTTPException: Если пользователь не найден.
+        HTTPException: Если токен недействителен или уже использован.
     """
-    email = decode_token(token)
-    user = await get_user_by_email(email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    await activate_user(email)
+    email, jti = verify_confirmation_token(token)
+    if not await activate_user(email, jti):
+        raise HTTPException(status_code=400, detail="Invalid or already used token")
 
     return {"message": "Email confirmed"}
 
+@auth_router.post("/resend-confirmation")
+async def resend_confirmation(request: Request, email: EmailStr):
+    """Отправляет новую ссылку для подтверждения электронной почты. Выданные ранее ссылки перестают действовать.
+
+    Args:
+        request (Request): Объект запроса.
+        email (EmailStr): Электронная почта пользователя.
+
+    Returns:
+        dict: Сообщение об отправке ссылки.
+
+    Raises:
+        HTTPException: Если пользователь не найден или уже активирован.
+    """
+    jti = new_jti()
+    if not await set_confirm_jti(email, jti):
+        raise HTTPException(status_code=404, detail="User not found or already activated")
+
+    confirmation_token = create_confirmation_token(email, jti)
+    send_confirmation_email(email, f"{request.base_url}auth/confirm?token={confirmation_token}")
+    return {"message": "Confirmation link sent to your email"}
+
 @auth_router.post("/token", response_model=Token)
 async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depends()):
     """Проверяет пароль и устанавливает токен доступа в cookies.
@@ -108,11 +129,11 @@ async def forgot_password(request: Request, email: EmailStr):
     Raises:
         HTTPException: Если пользователь не найден.
     """
-    user = await get_user_by_email(email)
-    if not user:
+    jti = new_jti()
+    if not await set_reset_jti(email, jti):
         raise HTTPException(status_code=404, detail="User not found")
 
-    reset_token = create_password_reset_token(email)
+    reset_token = create_password_reset_token(email, jti)
 
     # Use your actual frontend URL here
     reset_url = f"{request.base_url}auth/reset-password?token={reset_token}"
@@ -125,7 +146,7 @@ async def reset_password(
         token: str = Form(...),
         new_password: str = Form(...)
 ):
-    """Устанавливает новый пароль.
+    """Устанавливает новый пароль. Токен можно использовать один раз.
 
     Args:
         token (str): Токен для сброса пароля.
@@ -135,16 +156,13 @@ async def reset_password(
         dict: Сообщение об успешном обновлении пароля.
 
     Raises:
-        HTTPException: Если пользователь не найден.
+        HTTPException: Если токен недействителен или уже использован.
     """
-    email = verify_password_reset_token(token)
-    user = await get_user_by_email(email)
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    email, jti = verify_password_reset_token(token)
 
     # Update password in database
-    await update_password(email, get_password_hash(new_password))
+    if not await update_password(email, jti, get_password_hash(new_password)):
+        raise HTTPException(status_code=400, detail="Invalid or already used token")
 
     return {"message": "Password updated successfully"}
 
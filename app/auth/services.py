@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta, UTC
 from typing import Optional
 
@@ -6,7 +7,8 @@ from jose import JWTError, jwt
 from pydantic import EmailStr
 
 from app.database import get_user_by_username
-from .constants import pwd_context, SECRET_KEY, ALGORITHM
+from app.metrics import BCRYPT_LATENCY, observe
+from .constants import get_jwt_params, get_pwd_context
 
 def verify_password(plain_password, hashed_password):
     """Проверяет соответствие пароля его хешу.
@@ -18,7 +20,8 @@ def verify_password(plain_password, hashed_password):
     Returns:
         bool: True, если пароль соответствует хешу, иначе False.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    with observe(BCRYPT_LATENCY, operation="verify"):
+        return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     """Хеширует пароль.
@@ -29,7 +32,8 @@ def get_password_hash(password):
     Returns:
         str: Хешированный пароль.
     """
-    return pwd_context.hash(password)
+    with observe(BCRYPT_LATENCY, operation="hash"):
+        return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Создает токен доступа.
@@ -47,7 +51,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(UTC) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    secret_key, algorithm = get_jwt_params()
+    encoded_jwt = jwt.encode(to_encode, secret_key, algorithm=algorithm)
     return encoded_jwt
 
 def decode_token(token: str):
@@ -62,10 +67,12 @@ def decode_token(token: str):
     Raises:
         HTTPException: Если токен недействителен.
     """
+    secret_key, algorithm = get_jwt_params()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
         username: str = payload.get("sub")
-        if username is None:
+        # Одноразовые токены подтверждения и сброса пароля не являются токенами доступа
+        if username is None or payload.get("type") is not None:
             raise HTTPException(status_code=401, detail="Invalid token")
         return username
     except JWTError:
@@ -86,53 +93,94 @@ async def authenticate_user(username: str, password: str) -> dict | bool:
         return False
     return user
 
-def create_confirmation_token(email: EmailStr):
-    """Создает токен подтверждения электронной почты.
+def new_jti() -> str:
+    """Создает случайный идентификатор одноразового токена.
+
+    Returns:
+        str: Идентификатор токена.
+    """
+    return uuid.uuid4().hex
+
+def create_confirmation_token(email: EmailStr, jti: str):
+    """Создает одноразовый токен подтверждения электронной почты.
 
     Args:
         email (EmailStr): Электронная почта пользователя.
+        jti (str): Идентификатор токена, сохраненный у пользователя.
 
     Returns:
         str: Токен подтверждения.
     """
     expires_delta = timedelta(hours=24)
-    return create_access_token(data={"sub": email}, expires_delta=expires_delta)
+    return create_access_token(
+        data={"sub": email, "type": "email_confirmation", "jti": jti},
+        expires_delta=expires_delta
+    )
 
-def create_password_reset_token(email: EmailStr):
-    """Создает токен для сброса пароля.
+def create_password_reset_token(email: EmailStr, jti: str):
+    """Создает одноразовый токен для сброса пароля.
 
     Args:
         email (EmailStr): Электронная почта пользователя.
+        jti (str): Идентификатор токена, сохраненный у пользователя.
 
     Returns:
         str: Токен для сброса пароля.
     """
     expires_delta = timedelta(minutes=15)
     return create_access_token(
-        data={"sub": email, "type": "password_reset"},  # Add type distinction
+        data={"sub": email, "type": "password_reset", "jti": jti},  # Add type distinction
         expires_delta=expires_delta
     )
 
-def verify_password_reset_token(token: str) -> str:
+def verify_confirmation_token(token: str) -> tuple[str, str]:
+    """Проверяет токен подтверждения электронной почты.
+
+    Токены без типа не принимаются: так выглядят токены доступа.
+
+    Args:
+        token (str): Токен для проверки.
+
+    Returns:
+        tuple[str, str]: Электронная почта пользователя и идентификатор токена.
+
+    Raises:
+        HTTPException: Если токен недействителен или истек.
+    """
+    secret_key, algorithm = get_jwt_params()
+    try:
+        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    email: str = payload.get("sub")
+    jti: str = payload.get("jti")
+    if not email or not jti or payload.get("type") != "email_confirmation":
+        raise HTTPException(status_code=400, detail="Invalid token type")
+    return email, jti
+
+def verify_password_reset_token(token: str) -> tuple[str, str]:
     """Проверяет токен для сброса пароля.
 
     Args:
         token (str): Токен для проверки.
 
     Returns:
-        str: Электронная почта пользователя.
+        tuple[str, str]: Электронная почта пользователя и идентификатор токена.
 
     Raises:
         HTTPException: Если токен недействителен или истек.
     """
+    secret_key, algorithm = get_jwt_params()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
         email: str = payload.get("sub")
         token_type: str = payload.get("type")
+        jti: str = payload.get("jti")
 
-        if not email or token_type != "password_reset":
+        if not email or not jti or token_type != "password_reset":
             raise HTTPException(status_code=400, detail="Invalid token type")
 
-        return email
+        return email, jti
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
@@ -0,0 +1,88 @@
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict
+
+class Settings(BaseModel):
+    """Настройки приложения. Каждое поле читается из переменной окружения с тем же именем в верхнем регистре."""
+    model_config = ConfigDict(frozen=True)
+
+    # JWT
+    secret_key: str | None = None
+    algorithm: str | None = None
+
+    # MongoDB
+    mongo_uri: str | None = None
+    mongo_initdb_root_username: str | None = None
+    mongo_initdb_root_password: str | None = None
+
+    # SMTP
+    mail: str | None = None
+    mail_password: str | None = None
+    smtp_server: str | None = None
+
+    # Отладка
+    debug: bool = False
+    blocking_threshold_ms: float = 100
+
+    # Кеш ответов с группами задач
+    render_cache_size: int = 1024
+    render_cache_url: str | None = None
+    render_cache_ttl: int = 300
+
+    # Ограничение нагрузки
+    load_shedding: bool = True
+    tasks_concurrency: int = 64
+    tasks_target_latency: float = 0.25
+    tasks_queue_timeout: float = 1.0
+    auth_concurrency: int = 4
+    auth_target_latency: float = 1.0
+    auth_queue_timeout: float = 0.5
+
+    # Idempotency-Key
+    idempotency_ttl: int = 86400
+    # Сколько секунд запрос с ключом считается выполняющимся; после этого повтор может его перехватить
+    idempotency_lease: int = 60
+
+    # Архив задач
+    archive_interval: int = 300
+    archive_completed_after: int = 86400
+    archive_stale_days: int | None = None
+    archive_ttl_days: int | None = None
+    archive_batch_size: int = 100
+
+    # Сервер
+    host: str = "0.0.0.0"
+    port: int = 8000
+    web_concurrency: int | None = None
+    keepalive_timeout: int = 75
+    backlog: int = 2048
+    graceful_shutdown_timeout: int = 30
+
+    def require(self, *names: str):
+        """Проверяет, что перечисленные настройки заданы.
+
+        Args:
+            *names (str): Названия полей настроек.
+
+        Raises:
+            Exception: Если хотя бы одна из настроек не задана.
+        """
+        missing = [name.upper() for name in names if not getattr(self, name)]
+        if missing:
+            raise Exception(f"SET ALL .env variables: {', '.join(missing)}")
+
+@lru_cache
+def get_settings() -> Settings:
+    """Загружает .env и возвращает настройки. Результат кешируется.
+
+    Returns:
+        Settings: Настройки приложения.
+    """
+    load_dotenv()
+    return Settings(**{
+        name: os.environ[name.upper()]
+        for name in Settings.model_fields
+        if os.environ.get(name.upper())
+    })
@@ -1,36 +1,119 @@
-import os
+import asyncio
 
-from dotenv import load_dotenv
-from pymongo import AsyncMongoClient
+from pymongo import ASCENDING, DESCENDING, TEXT, AsyncMongoClient
 
-load_dotenv()
+from app.config import get_settings
+from app.metrics import MongoCommandMetrics, MongoPoolMetrics
 
-client = AsyncMongoClient(
-    host="mongo",
-    port=27017,
-    username=os.getenv("MONGO_INITDB_ROOT_USERNAME"),
-    password=os.getenv("MONGO_INITDB_ROOT_PASSWORD"),
-    authSource="admin"
-)
+pool_metrics = MongoPoolMetrics()
 
-db = client.todo_db
-users = db.users
+client: AsyncMongoClient | None = None
+db = None
+users = None
+task_search = None
+archived_tasks = None
+idempotency_keys = None
+
+def connect():
+    """Создает клиент MongoDB для текущего процесса.
+
+    Вызывается из lifespan, поэтому у каждого воркера свой клиент и пул соединений.
+    Если клиент уже задан (например, подменен в бенчмарке), он переиспользуется.
+    """
+    global client, db, users, task_search, archived_tasks, idempotency_keys
+    settings = get_settings()
+    if client is None:
+        if settings.mongo_uri:
+            client = AsyncMongoClient(
+                settings.mongo_uri,
+                event_listeners=[MongoCommandMetrics(), pool_metrics],
+            )
+        else:
+            client = AsyncMongoClient(
+                host="mongo",
+                port=27017,
+                username=settings.mongo_initdb_root_username,
+                password=settings.mongo_initdb_root_password,
+                authSource="admin",
+                event_listeners=[MongoCommandMetrics(), pool_metrics],
+            )
+    db = client.todo_db
+    users = db.users
+    task_search = db.task_search
+    archived_tasks = db.archived_tasks
+    idempotency_keys = db.idempotency_keys
+
+async def disconnect():
+    """Закрывает клиент MongoDB текущего процесса."""
+    global client, db, users, task_search, archived_tasks, idempotency_keys
+    if isinstance(client, AsyncMongoClient):
+        await client.close()
+    client = db = users = task_search = archived_tasks = idempotency_keys = None
 
 async def on_init():
-    """Инициализирует индексы для коллекции пользователей в базе данных."""
+    """Инициализирует индексы коллекций пользователей, поиска, архива задач и ключей идемпотентности."""
     await users.create_index("username", unique=True)
     await users.create_index("email", unique=True)
+    # Для поиска пользователей с выполненными задачами в архиваторе
+    await users.create_index("todo.tasks.completed_at", sparse=True)
+    # Текстовый индекс с префиксом user_id: поиск всегда идет внутри одного пользователя
+    await task_search.create_index(
+        [("user_id", ASCENDING), ("title", TEXT), ("description", TEXT)],
+        name="user_text",
+        weights={"title": 5, "description": 1},
+        default_language="none",
+    )
+    await task_search.create_index("group_id")
+    await archived_tasks.create_index([("user_id", ASCENDING), ("archived_at", DESCENDING), ("_id", DESCENDING)])
+    settings = get_settings()
+    await idempotency_keys.create_index("created_at", expireAfterSeconds=settings.idempotency_ttl)
+    if settings.archive_stale_days:
+        # Для поиска пользователей со старыми задачами: без него $or архиватора становится COLLSCAN.
+        # Индекс содержит запись на каждую задачу, поэтому создается, только если архивация старых задач включена
+        await users.create_index("todo.tasks._id", name="stale_tasks")
+    ttl_days = settings.archive_ttl_days
+    if ttl_days:
+        await archived_tasks.create_index("archived_at", name="archived_ttl", expireAfterSeconds=ttl_days * 86400)
+
+async def ping(timeout: float) -> bool:
+    """Проверяет доступность MongoDB.
+
+    Args:
+        timeout (float): Максимальное время ожидания ответа в секундах.
+
+    Returns:
+        bool: True, если MongoDB ответила вовремя, иначе False.
+    """
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+    except Exception:
+        return False
+    return True
+
+def pool_saturation() -> float | None:
+    """Возвращает долю занятых соединений в пуле MongoDB.
 
-async def get_user_by_username(username: str):
+    Returns:
+        float | None: Отношение занятых соединений к максимальному размеру пула
+            или None, если у клиента нет настроек пула (например, mongomock).
+    """
+    options = getattr(client, "options", None)
+    max_pool_size = getattr(getattr(options, "pool_options", None), "max_pool_size", None)
+    if not isinstance(max_pool_size, int) or max_pool_size <= 0:
+        return None
+    return pool_metrics.checked_out / max_pool_size
+
+async def get_user_by_username(username: str, projection: dict | None = None):
     """Получает пользователя по имени пользователя.
 
     Args:
         username (str): Имя пользователя для поиска.
+        projection (dict | None): Поля, которые нужно вернуть. По умолчанию весь документ.
 
     Returns:
         dict: Документ пользователя, если найден, иначе None.
     """
-    return await users.find_one({"username": username})
+    return await users.find_one({"username": username}, projection)
 
 async def get_user_by_email(email: str):
     """Получает пользователя по электронной почте.
@@ -43,13 +126,18 @@ async def get_user_by_email(email: str):
     """
     return await users.find_one({"email": email})
 
-async def add_user(username, email, hashed_password):
+# Версия подсчета group_count и task_count (см. app.tasks.counters). Увеличивается,
+# если меняется способ подсчета, чтобы все документы были пересчитаны
+COUNTERS_VERSION = 1
+
+async def add_user(username, email, hashed_password, confirm_jti):
     """Добавляет нового пользователя в базу данных.
 
     Args:
         username (str): Имя пользователя.
         email (str): Электронная почта пользователя.
         hashed_password (str): Хешированный пароль пользователя.
+        confirm_jti (str): Идентификатор токена подтверждения почты.
     """
     await users.insert_one(
         dict(
@@ -57,23 +145,79 @@ async def add_user(username, email, hashed_password):
             email=email,
             hashed_password=hashed_password,
             is_active=False,
+            confirm_jti=confirm_jti,
+            group_count=0,
+            task_count=0,
+            counters_version=COUNTERS_VERSION,
             todo=[],
         )
     )
 
-async def activate_user(email):
-    """Активирует пользователя, устанавливая флаг is_active в True.
+async def activate_user(email, jti):
+    """Активирует пользователя по одноразовому токену подтверждения одним запросом.
+
+    Идентификатор токена удаляется из документа, поэтому повторно использовать
+    токен нельзя.
 
     Args:
         email (str): Электронная почта пользователя для активации.
+        jti (str): Идентификатор токена подтверждения.
+
+    Returns:
+        dict | None: Документ пользователя с _id или None, если токен уже использован или не найден.
     """
-    await users.update_one({"email": email}, {"$set": {"is_active": True}})
+    return await users.find_one_and_update(
+        {"email": email, "confirm_jti": jti},
+        {"$set": {"is_active": True}, "$unset": {"confirm_jti": ""}},
+        projection={"_id": 1},
+    )
 
-async def update_password(email, password):
-    """Обновляет пароль пользователя.
+async def set_confirm_jti(email, jti):
+    """Сохраняет новый идентификатор токена подтверждения неактивированного пользователя.
+    Выданные ранее токены подтверждения перестают действовать.
+
+    Args:
+        email (str): Электронная почта пользователя.
+        jti (str): Идентификатор токена подтверждения.
+
+    Returns:
+        dict | None: Документ пользователя с _id или None, если пользователь не найден или уже активирован.
+    """
+    return await users.find_one_and_update(
+        {"email": email, "is_active": False},
+        {"$set": {"confirm_jti": jti}},
+        projection={"_id": 1},
+    )
+
+async def set_reset_jti(email, jti):
+    """Сохраняет идентификатор токена сброса пароля. Выданные ранее токены перестают действовать.
+
+    Args:
+        email (str): Электронная почта пользователя.
+        jti (str): Идентификатор токена сброса пароля.
+
+    Returns:
+        dict | None: Документ пользователя с _id или None, если пользователь не найден.
+    """
+    return await users.find_one_and_update(
+        {"email": email},
+        {"$set": {"reset_jti": jti}},
+        projection={"_id": 1},
+    )
+
+async def update_password(email, jti, password):
+    """Обновляет пароль пользователя по одноразовому токену сброса пароля одним запросом.
 
     Args:
         email (str): Электронная почта пользователя для обновления.
+        jti (str): Идентификатор токена сброса пароля.
         password (str): Новый хешированный пароль.
+
+    Returns:
+        dict | None: Документ пользователя с _id или None, если токен уже использован или не найден.
     """
-    await users.update_one({"email": email}, {"$set": {"hashed_password": password}})
+    return await users.find_one_and_update(
+        {"email": email, "reset_jti": jti},
+        {"$set": {"hashed_password": password}, "$unset": {"reset_jti": ""}},
+        projection={"_id": 1},
+    )
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+
+from starlette.responses import HTMLResponse, Response
+
+from app.config import get_settings
+
+PROFILE_HEADER = b"x-profile"
+
+logger = logging.getLogger(__name__)
+
+def fold_stack(frame) -> str:
+    """Сворачивает стек вызовов в строку формата collapsed stacks (flamegraph.pl, speedscope).
+
+    Args:
+        frame: Верхний кадр стека.
+
+    Returns:
+        str: Кадры от корня к вершине, разделенные точкой с запятой.
+    """
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+class BlockingDetector:
+    """Обнаруживает блокировки цикла событий.
+
+    Корутина run() обновляет метку времени в цикле событий, а отдельный поток
+    проверяет, как давно она обновлялась. Если цикл не отвечает дольше порога,
+    в лог пишется стек потока цикла событий в момент блокировки в формате
+    collapsed stacks, поэтому строки из лога можно сразу передать flamegraph.pl.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self.interval = self.threshold / 4
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._stopped = threading.Event()
+
+    async def run(self):
+        """Запускает поток-наблюдатель и обновляет метку времени до отмены."""
+        self._loop_thread_id = threading.get_ident()
+        watcher = threading.Thread(target=self._watch, name="blocking-detector", daemon=True)
+        watcher.start()
+        try:
+            while True:
+                self._heartbeat = time.monotonic()
+                await asyncio.sleep(self.interval)
+        finally:
+            self._stopped.set()
+
+    def _watch(self):
+        """Проверяет метку времени и логирует стек цикла событий при блокировке."""
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat
+            if blocked_for < self.threshold or heartbeat == reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported = heartbeat
+            logger.warning(
+                "Event loop blocked for more than %.0f ms\n%s 1",
+                blocked_for * 1000,
+                fold_stack(frame),
+            )
+
+class ProfilingMiddleware:
+    """ASGI middleware, профилирующее запрос при наличии заголовка X-Profile в режиме отладки.
+
+    Вместо ответа обработчика возвращается результат pyinstrument:
+    ``X-Profile: speedscope`` (по умолчанию) отдает JSON для speedscope,
+    ``X-Profile: html`` - интерактивный HTML отчет.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not get_settings().debug:
+            await self.app(scope, receive, send)
+            return
+
+        profile_format = dict(scope["headers"]).get(PROFILE_HEADER)
+        if profile_format is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            from pyinstrument import Profiler
+            from pyinstrument.renderers import SpeedscopeRenderer
+        except ImportError:
+            logger.warning("pyinstrument is not installed, request is not profiled")
+            await self.app(scope, receive, send)
+            return
+
+        async def discard(_message):
+            pass
+
+        profiler = Profiler(interval=0.001, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+
+        if profile_format == b"html":
+            response = HTMLResponse(profiler.output_html())
+        else:
+            response = Response(profiler.output(SpeedscopeRenderer()), media_type="application/json")
+        await response(scope, receive, send)
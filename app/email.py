@@ -1,22 +1,93 @@
-import os
+import asyncio
+import logging
 import smtplib
 from email.mime.text import MIMEText
 
-from dotenv import load_dotenv
 from pydantic import EmailStr
 
-load_dotenv()
-MAIL = os.getenv("MAIL")
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-SMTP_SERVER = os.getenv("SMTP_SERVER")
+from app.config import get_settings
+from app.metrics import EMAIL_BACKLOG, SMTP_LATENCY, observe
 
-if not all((MAIL, MAIL_PASSWORD, SMTP_SERVER)):
-    raise Exception(
-        f"SET ALL .env variables: {MAIL=}, {MAIL_PASSWORD=}, {SMTP_SERVER=}"
-    )
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 2
+
+outbox: asyncio.Queue[MIMEText] = asyncio.Queue()
+
+def email_backlog() -> int:
+    """Возвращает количество писем, ожидающих отправки.
+
+    Returns:
+        int: Размер очереди писем.
+    """
+    return outbox.qsize()
+
+def _enqueue(msg: MIMEText):
+    outbox.put_nowait(msg)
+    EMAIL_BACKLOG.set(outbox.qsize())
+
+def check_smtp_settings():
+    """Проверяет, что заданы настройки SMTP.
+
+    Raises:
+        Exception: Если переменные окружения не заданы.
+    """
+    get_settings().require("mail", "mail_password", "smtp_server")
+
+def _deliver(msg: MIMEText):
+    """Отправляет письмо через SMTP. Блокирующая операция.
+
+    Args:
+        msg (MIMEText): Письмо для отправки.
+    """
+    settings = get_settings()
+    with observe(SMTP_LATENCY), smtplib.SMTP_SSL(settings.smtp_server, 465) as server:
+        server.login(settings.mail.split("@")[0], settings.mail_password)
+        server.sendmail(settings.mail, [msg["To"]], msg.as_string())
+
+async def _deliver_with_retry(msg: MIMEText):
+    """Отправляет письмо, повторяя попытку при ошибке SMTP до MAX_ATTEMPTS раз.
+
+    Args:
+        msg (MIMEText): Письмо для отправки.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            await asyncio.to_thread(_deliver, msg)
+            return
+        except (smtplib.SMTPException, OSError):
+            if attempt == MAX_ATTEMPTS:
+                logger.exception("Failed to send email to %s after %s attempts", msg["To"], attempt)
+                return
+            logger.warning("Failed to send email to %s, retrying", msg["To"], exc_info=True)
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+async def run_outbox_worker():
+    """Отправляет письма из очереди в отдельном потоке, не блокируя цикл событий."""
+    while True:
+        msg = await outbox.get()
+        EMAIL_BACKLOG.set(outbox.qsize())
+        try:
+            await _deliver_with_retry(msg)
+        except Exception:
+            logger.exception("Failed to send email to %s", msg["To"])
+        finally:
+            outbox.task_done()
+
+async def drain_outbox(timeout: float):
+    """Ждет отправки писем из очереди перед остановкой приложения.
+
+    Args:
+        timeout (float): Максимальное время ожидания в секундах.
+    """
+    try:
+        await asyncio.wait_for(outbox.join(), timeout)
+    except TimeoutError:
+        logger.error("Shutting down with %s unsent emails", outbox.qsize())
 
 def send_update_password_email(email: EmailStr, reset_url: str):
-    """Отправляет письмо со ссылкой для сброса пароля пользователя.
+    """Ставит в очередь письмо со ссылкой для сброса пароля пользователя.
 
     Args:
         email (EmailStr): Адрес электронной почты пользователя.
@@ -27,15 +98,13 @@ def send_update_password_email(email: EmailStr, reset_url: str):
     Эта ссылка истечет через 15 минут.""")
 
     msg["Subject"] = "Запрос на сброс пароля"
-    msg["From"] = MAIL
-    msg["To"] = email
+    msg["From"] = get_settings().mail
+    msg["To"] = str(email)
 
-    with smtplib.SMTP_SSL(SMTP_SERVER, 465) as server:
-        server.login(MAIL.split("@")[0], MAIL_PASSWORD)
-        server.sendmail(MAIL, [str(email)], msg.as_string())
+    _enqueue(msg)
 
 def send_confirmation_email(email: EmailStr, token_url: str):
-    """Отправляет письмо со ссылкой для подтверждения электронной почты пользователя.
+    """Ставит в очередь письмо со ссылкой для подтверждения электронной почты пользователя.
 
     Args:
         email (EmailStr): Адрес электронной почты пользователя.
@@ -43,9 +112,7 @@ def send_confirmation_email(email: EmailStr, token_url: str):
     """
     msg = MIMEText(f"Нажмите на ссылку, чтобы подтвердить вашу электронную почту: {token_url}")
     msg["Subject"] = "Подтвердите вашу электронную почту"
-    msg["From"] = MAIL
-    msg["To"] = email
+    msg["From"] = get_settings().mail
+    msg["To"] = str(email)
 
-    with smtplib.SMTP_SSL(SMTP_SERVER, 465) as server:
-        server.login(MAIL.split("@")[0], MAIL_PASSWORD)
-        server.sendmail(MAIL, [str(email)], msg.as_string())
+    _enqueue(msg)
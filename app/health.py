@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from fastapi import APIRouter, Response
+
+from app.database import ping, pool_saturation
+from app.email import email_backlog
+
+MONGO_PING_TIMEOUT = 1.0
+READINESS_CACHE_SECONDS = 5.0
+
+health_router = APIRouter(tags=["health"])
+
+_mongo_checked_at = float("-inf")
+_mongo_ok = False
+_mongo_lock = asyncio.Lock()
+
+async def _mongo_available() -> bool:
+    """Проверяет MongoDB не чаще одного раза в READINESS_CACHE_SECONDS.
+
+    Returns:
+        bool: Результат последней проверки MongoDB.
+    """
+    global _mongo_checked_at, _mongo_ok
+    if time.monotonic() - _mongo_checked_at < READINESS_CACHE_SECONDS:
+        return _mongo_ok
+    async with _mongo_lock:
+        if time.monotonic() - _mongo_checked_at >= READINESS_CACHE_SECONDS:
+            _mongo_ok = await ping(MONGO_PING_TIMEOUT)
+            _mongo_checked_at = time.monotonic()
+    return _mongo_ok
+
+@health_router.get("/health")
+async def health():
+    """Проверка живости процесса. Не обращается к внешним зависимостям.
+
+    Returns:
+        dict: Статус приложения.
+    """
+    return {"status": "ok"}
+
+@health_router.get("/ready")
+async def ready(response: Response):
+    """Проверка готовности принимать трафик.
+
+    Args:
+        response (Response): Объект ответа.
+
+    Returns:
+        dict: Состояние MongoDB, загруженность пула соединений и размер очереди писем.
+    """
+    mongo_ok = await _mongo_available()
+    if not mongo_ok:
+        response.status_code = 503
+    saturation = pool_saturation()
+    return {
+        "status": "ok" if mongo_ok else "unavailable",
+        "mongo": mongo_ok,
+        "mongo_pool_saturation": round(saturation, 3) if saturation is not None else None,
+        "email_backlog": email_backlog(),
+    }
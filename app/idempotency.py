@@ -0,0 +1,262 @@
+"""Повторы запросов по заголовку Idempotency-Key.
+
+Клиент передает в изменяющем запросе заголовок ``Idempotency-Key`` с уникальным
+значением. Первый ответ сохраняется в коллекции idempotency_keys (записи удаляются
+по TTL индексу) и в LRU кеше процесса, а повторный запрос с тем же ключом получает
+сохраненный ответ без выполнения обработчика и без обращения к документу пользователя.
+
+Ключи действуют в пределах пользователя из токена доступа, а для регистрации -
+в пределах имени пользователя и электронной почты из запроса. Запросы без токена
+к /task-groups выполняются без проверки ключа. Повтор с тем же ключом, но другим
+запросом отклоняется с кодом 422, а повтор, пока первый запрос еще выполняется, -
+с кодом 409. Ответы с кодом 5xx не сохраняются.
+
+Выполняющийся запрос держит аренду на IDEMPOTENCY_LEASE секунд. Если воркер
+остановился, не завершив запрос, повтор после окончания аренды перехватывает
+запись и выполняет запрос сам, а не получает 409 до удаления записи по TTL.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, UTC
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+from starlette.datastructures import Headers, QueryParams
+
+from app import database
+from app.auth.services import decode_token
+from app.config import get_settings
+from app.metrics import IDEMPOTENT_REPLAYS
+
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_KEY_LENGTH = 255
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+def is_idempotent_route(method: str, path: str) -> bool:
+    """Проверяет, поддерживает ли маршрут Idempotency-Key.
+
+    Args:
+        method (str): HTTP метод.
+        path (str): Путь запроса.
+
+    Returns:
+        bool: True для изменяющих запросов к /task-groups и для регистрации.
+    """
+    if method not in MUTATING_METHODS:
+        return False
+    return path.startswith("/task-groups/") or (method == "POST" and path == "/auth/register")
+
+def request_owner(scope, headers: Headers) -> str | None:
+    """Определяет владельца ключа без запроса к базе данных.
+
+    Для регистрации владелец - пара имени пользователя и электронной почты из параметров
+    запроса, для остальных маршрутов - пользователь из токена доступа.
+
+    Args:
+        scope: ASGI scope запроса.
+        headers (Headers): Заголовки запроса.
+
+    Returns:
+        str | None: Владелец ключа или None, если его нельзя определить (нет параметров
+            регистрации, нет токена или токен недействителен).
+    """
+    if scope["path"] == "/auth/register":
+        params = QueryParams(scope["query_string"])
+        username, email = params.get("username"), params.get("email")
+        if not username or not email:
+            return None
+        return f"register\0{username}\0{email.lower()}"
+    authorization = headers.get("authorization")
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    try:
+        return decode_token(token)
+    except HTTPException:
+        return None
+
+async def json_response(send, status: int, detail: str):
+    """Отправляет ответ с ошибкой в формате FastAPI: ``{"detail": ...}``.
+
+    Args:
+        send: ASGI send.
+        status (int): Код ответа.
+        detail (str): Описание ошибки.
+    """
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class IdempotencyMiddleware:
+    """ASGI middleware, отвечающее на повторы запросов сохраненными ответами.
+
+    Args:
+        app: ASGI приложение.
+        cache_size (int): Количество ответов в LRU кеше процесса.
+    """
+
+    def __init__(self, app, cache_size: int = 1024):
+        self.app = app
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_idempotent_route(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        key = headers.get("idempotency-key")
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await json_response(send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+            return
+        owner = request_owner(scope, headers)
+        if owner is None:
+            # Обработчик сам вернет 401 или 422
+            await self.app(scope, receive, send)
+            return
+
+        body, receive = await self._read_body(receive)
+        record_id = hashlib.sha256(f"{owner}\0{key}".encode()).hexdigest()
+        fingerprint = hashlib.sha256(
+            b"\0".join([scope["method"].encode(), scope["path"].encode(), scope["query_string"], body])
+        ).hexdigest()
+
+        record = self._cached(record_id)
+        if record is not None:
+            await self._replay(record, fingerprint, send, "local")
+            return
+
+        now = datetime.now(UTC)
+        locked_until = now + timedelta(seconds=get_settings().idempotency_lease)
+        try:
+            await database.idempotency_keys.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "status": IN_PROGRESS,
+                "created_at": now,
+                "locked_until": locked_until,
+            })
+        except DuplicateKeyError:
+            # Аренда истекла: первый запрос не завершился (например, воркер был остановлен)
+            taken_over = await database.idempotency_keys.find_one_and_update(
+                {
+                    "_id": record_id,
+                    "status": IN_PROGRESS,
+                    "fingerprint": fingerprint,
+                    "locked_until": {"$not": {"$gt": now}},
+                },
+                {"$set": {"locked_until": locked_until}},
+                projection={"_id": 1},
+            )
+            if taken_over is None:
+                await self._handle_existing(scope, receive, send, record_id, fingerprint)
+                return
+
+        await self._execute(scope, receive, send, record_id, fingerprint)
+
+    async def _handle_existing(self, scope, receive, send, record_id: str, fingerprint: str):
+        """Отвечает на повтор, когда запись ключа уже существует и не перехвачена."""
+        record = await database.idempotency_keys.find_one({"_id": record_id})
+        if record is None:
+            # Запись удалена после ошибки первого запроса: выполняем этот без сохранения
+            await self.app(scope, receive, send)
+        elif record["fingerprint"] != fingerprint:
+            await json_response(send, 422, "Idempotency-Key was already used for a different request")
+        elif record["status"] == IN_PROGRESS:
+            await json_response(send, 409, "A request with this Idempotency-Key is in progress")
+        else:
+            self._store(record_id, record)
+            await self._replay(record, fingerprint, send, "shared")
+
+    async def _execute(self, scope, receive, send, record_id: str, fingerprint: str):
+        """Выполняет запрос и сохраняет ответ, если он не 5xx."""
+        response = {"status": 500, "headers": [], "body": b""}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [[name, value] for name, value in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            await database.idempotency_keys.delete_one({"_id": record_id})
+            raise
+
+        if response["status"] >= 500:
+            await database.idempotency_keys.delete_one({"_id": record_id})
+            return
+        record = {"fingerprint": fingerprint, "status": COMPLETED, **response}
+        await database.idempotency_keys.update_one({"_id": record_id}, {"$set": record})
+        self._store(record_id, record)
+
+    @staticmethod
+    async def _read_body(receive):
+        """Читает тело запроса и возвращает receive, который отдаст его обработчику еще раз."""
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return body, replay_receive
+
+    @staticmethod
+    async def _replay(record: dict, fingerprint: str, send, source: str):
+        """Отправляет сохраненный ответ или 422, если ключ использован для другого запроса."""
+        if record["fingerprint"] != fingerprint:
+            await json_response(send, 422, "Idempotency-Key was already used for a different request")
+            return
+        IDEMPOTENT_REPLAYS.labels(source).inc()
+        headers = [(bytes(name), bytes(value)) for name, value in record["headers"]]
+        await send({
+            "type": "http.response.start",
+            "status": record["status"],
+            "headers": headers + [(b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": bytes(record["body"])})
+
+    def _cached(self, record_id: str) -> dict | None:
+        item = self._cache.get(record_id)
+        if item is None:
+            return None
+        record, expires = item
+        if expires < time.monotonic():
+            del self._cache[record_id]
+            return None
+        self._cache.move_to_end(record_id)
+        return record
+
+    def _store(self, record_id: str, record: dict):
+        self._cache[record_id] = (record, time.monotonic() + get_settings().idempotency_ttl)
+        self._cache.move_to_end(record_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,257 @@
+"""Адаптивное ограничение параллельных запросов и сброс нагрузки.
+
+Запросы делятся на классы по маршруту: ``auth`` (bcrypt при входе и регистрации,
+низкий приоритет) и ``tasks`` (группы и задачи). У каждого класса свой лимит
+одновременно выполняемых запросов, который подстраивается по схеме AIMD:
+если запросы выполняются быстрее целевой задержки, лимит медленно растет, если
+медленнее - уменьшается в несколько раз. Запросы сверх лимита ждут в короткой
+очереди; если место не освободилось до дедлайна или очередь заполнена, сразу
+возвращается 503 с заголовком Retry-After. Пока в очереди высокоприоритетного
+класса есть ожидающие, запросы низкоприоритетного класса не ставятся в очередь.
+
+Лимиты действуют в пределах воркера. Служебные маршруты и поток событий
+``/task-groups/-/events`` не ограничиваются.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+
+from app.config import get_settings
+from app.metrics import CONCURRENCY_IN_FLIGHT, CONCURRENCY_LIMIT, CONCURRENCY_QUEUED, REQUESTS_SHED
+
+class Shed(Exception):
+    """Запрос отклонен ограничителем. Аргумент - причина."""
+
+class AdaptiveLimiter:
+    """Ограничитель параллельных запросов одного класса с AIMD лимитом.
+
+    Args:
+        name (str): Название класса запросов для метрик.
+        limit (int): Начальный лимит.
+        min_limit (int): Минимальный лимит.
+        max_limit (int): Максимальный лимит.
+        target_latency (float): Целевая задержка обработки в секундах.
+        queue_timeout (float): Максимальное время ожидания в очереди в секундах.
+        max_queue (int): Максимальная длина очереди.
+        backoff (float): Множитель уменьшения лимита при превышении целевой задержки.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            limit: int,
+            min_limit: int,
+            max_limit: int,
+            target_latency: float,
+            queue_timeout: float,
+            max_queue: int,
+            backoff: float = 0.7,
+    ):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._decreased_at = float("-inf")
+        self._publish()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, allow_queue: bool = True):
+        """Занимает место для запроса, при необходимости ожидая в очереди.
+
+        Args:
+            allow_queue (bool): Можно ли ждать в очереди, если лимит исчерпан.
+
+        Raises:
+            Shed: Если место не получено.
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self._publish()
+            return
+        if not allow_queue:
+            raise Shed("priority")
+        if len(self._waiters) >= self.max_queue:
+            raise Shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Место выдано одновременно с дедлайном или отменой запроса - отдаем его следующему
+                self.in_flight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+            if isinstance(e, TimeoutError):
+                raise Shed("deadline")
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._publish()
+
+    def release(self, latency: float, failed: bool | None):
+        """Освобождает место и подстраивает лимит по задержке запроса.
+
+        Args:
+            latency (float): Время обработки запроса в секундах.
+            failed (bool | None): Завершился ли запрос ошибкой сервера. None, если исход
+                неизвестен (клиент отключился до ответа) - тогда лимит не меняется.
+        """
+        self.in_flight -= 1
+        if failed is not None:
+            self._adjust(latency, failed)
+        self._wake()
+        self._publish()
+
+    def _adjust(self, latency: float, failed: bool):
+        """Уменьшает лимит после медленного или неудачного запроса и медленно увеличивает после быстрого."""
+        now = time.monotonic()
+        if failed or latency > self.target_latency:
+            # Не чаще одного уменьшения за целевую задержку, чтобы одна медленная волна не обнулила лимит
+            if now - self._decreased_at > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._decreased_at = now
+        elif self.in_flight + 1 >= int(self.limit):
+            # Лимит растет, только когда он действительно был исчерпан
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _wake(self):
+        """Передает освободившиеся места ожидающим в порядке очереди."""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _publish(self):
+        CONCURRENCY_LIMIT.labels(self.name).set(int(self.limit))
+        CONCURRENCY_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        CONCURRENCY_QUEUED.labels(self.name).set(len(self._waiters))
+
+def route_class(method: str, path: str) -> str | None:
+    """Определяет класс запроса по маршруту.
+
+    Args:
+        method (str): HTTP метод.
+        path (str): Путь запроса.
+
+    Returns:
+        str | None: ``auth``, ``tasks`` или None, если запрос не ограничивается.
+    """
+    if path.startswith("/auth/"):
+        return "auth"
+    if path == "/users/me":
+        return "tasks"
+    if path.startswith("/task-groups/"):
+        if method == "GET" and path.rstrip("/") == "/task-groups/-/events":
+            return None
+        return "tasks"
+    return None
+
+def create_limiters() -> dict[str, AdaptiveLimiter]:
+    """Создает ограничители классов запросов по настройкам.
+
+    Returns:
+        dict[str, AdaptiveLimiter]: Ограничители по названию класса.
+    """
+    settings = get_settings()
+    return {
+        "tasks": AdaptiveLimiter(
+            "tasks",
+            limit=settings.tasks_concurrency,
+            min_limit=4,
+            max_limit=settings.tasks_concurrency * 4,
+            target_latency=settings.tasks_target_latency,
+            queue_timeout=settings.tasks_queue_timeout,
+            max_queue=settings.tasks_concurrency * 2,
+        ),
+        "auth": AdaptiveLimiter(
+            "auth",
+            limit=settings.auth_concurrency,
+            min_limit=1,
+            max_limit=settings.auth_concurrency * 4,
+            target_latency=settings.auth_target_latency,
+            queue_timeout=settings.auth_queue_timeout,
+            max_queue=settings.auth_concurrency,
+        ),
+    }
+
+# Классы в порядке убывания приоритета
+PRIORITY = ["tasks", "auth"]
+
+class LoadSheddingMiddleware:
+    """ASGI middleware, ограничивающее параллельные запросы по классам маршрутов."""
+
+    def __init__(self, app):
+        self.app = app
+        self.limiters: dict[str, AdaptiveLimiter] | None = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not get_settings().load_shedding:
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.limiters is None:
+            self.limiters = create_limiters()
+        limiter = self.limiters[name]
+        higher = PRIORITY[:PRIORITY.index(name)]
+        allow_queue = not any(self.limiters[other].queued for other in higher)
+
+        try:
+            await limiter.acquire(allow_queue)
+        except Shed as e:
+            REQUESTS_SHED.labels(name, str(e)).inc()
+            await self._reject(send)
+            return
+
+        # None, пока ответ не начат: отключение клиента не считается ни успехом, ни ошибкой
+        failed = None
+
+        async def send_wrapper(message):
+            nonlocal failed
+            if message["type"] == "http.response.start":
+                failed = message["status"] >= 500
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if failed is None:
+                failed = True
+            raise
+        finally:
+            limiter.release(time.perf_counter() - start, failed)
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"detail": "Server is overloaded, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
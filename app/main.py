@@ -1,23 +1,66 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Depends
 
+from app import database
+from app.auth.constants import get_jwt_params, get_pwd_context
 from app.auth.dependencies import get_current_user
 from app.auth.router import auth_router
-from app.database import on_init
+from app.config import get_settings
+from app.debug import BlockingDetector, ProfilingMiddleware
+from app.email import check_smtp_settings, drain_outbox, run_outbox_worker
+from app.health import health_router
+from app.idempotency import IdempotencyMiddleware
+from app.limits import LoadSheddingMiddleware
+from app.metrics import MetricsMiddleware, mark_worker_dead, metrics_response, monitor_event_loop_lag
 from app.models import User
+from app.tasks.archive import run_archiver
+from app.tasks.events import change_feed
 from app.tasks.routes import tasks_router
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    """Инициализирует приложение с индексами базы данных."""
-    await on_init()
+    """Проверяет настройки, подключается к базе данных, создает индексы и запускает фоновые задачи.
+
+    Все внешние ресурсы создаются здесь, а не при импорте модулей.
+    """
+    settings = get_settings()
+    get_jwt_params()
+    check_smtp_settings()
+    get_pwd_context()
+    database.connect()
+    await database.on_init()
+    background = [
+        asyncio.create_task(monitor_event_loop_lag()),
+        asyncio.create_task(run_outbox_worker()),
+        asyncio.create_task(run_archiver()),
+    ]
+    if settings.debug:
+        background.append(asyncio.create_task(BlockingDetector(settings.blocking_threshold_ms).run()))
     yield
+    # Письма уже обещаны пользователям, поэтому очередь отправляется до остановки воркера
+    await drain_outbox(settings.graceful_shutdown_timeout)
+    for task in background:
+        task.cancel()
+    change_feed.close()
+    await database.disconnect()
+    mark_worker_dead()
 
 app = FastAPI(lifespan=lifespan)
 
+app.include_router(health_router)
 app.include_router(auth_router)
 app.include_router(tasks_router)
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(LoadSheddingMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Возвращает метрики приложения в формате Prometheus."""
+    return metrics_response()
 
 @app.get("/users/me")
 async def read_users_me(current_user: User = Depends(get_current_user)):
@@ -0,0 +1,230 @@
+"""Метрики Prometheus.
+
+При нескольких воркерах uvicorn каждый процесс пишет метрики в файлы каталога
+PROMETHEUS_MULTIPROC_DIR, а /metrics собирает их из всех процессов, поэтому
+ответ не зависит от того, какой воркер обработал запрос Prometheus.
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+from pymongo import monitoring
+from starlette.responses import Response
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP запроса",
+    ["method", "route", "status"],
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "Время выполнения команды MongoDB",
+    ["command", "outcome"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5),
+)
+BCRYPT_LATENCY = Histogram(
+    "bcrypt_duration_seconds",
+    "Время хеширования и проверки паролей",
+    ["operation"],
+)
+SMTP_LATENCY = Histogram(
+    "smtp_duration_seconds",
+    "Время отправки письма через SMTP",
+    buckets=(.05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Задержка пробуждения цикла событий относительно ожидаемого времени",
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0),
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out_connections",
+    "Количество соединений MongoDB, занятых в данный момент",
+    multiprocess_mode="livesum",
+)
+EMAIL_BACKLOG = Gauge(
+    "email_outbox_backlog",
+    "Количество писем, ожидающих отправки",
+    multiprocess_mode="livesum",
+)
+SSE_SUBSCRIBERS = Gauge(
+    "sse_subscribers",
+    "Количество открытых подписок на изменения задач",
+    multiprocess_mode="livesum",
+)
+RENDER_CACHE_REQUESTS = Counter(
+    "render_cache_requests",
+    "Обращения к кешу ответов с группами задач по уровням кеша",
+    ["tier", "result"],
+)
+RENDER_CACHE_BYTES_SAVED = Counter(
+    "render_cache_saved_bytes",
+    "Объем ответов, отданных из кеша без сериализации",
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "idempotent_replays",
+    "Ответы на повторные запросы с Idempotency-Key из сохраненных ответов",
+    ["source"],
+)
+CONCURRENCY_LIMIT = Gauge(
+    "concurrency_limit",
+    "Текущий адаптивный лимит параллельных запросов класса",
+    ["route_class"],
+    multiprocess_mode="liveall",
+)
+CONCURRENCY_IN_FLIGHT = Gauge(
+    "concurrency_in_flight",
+    "Количество выполняющихся запросов класса",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+CONCURRENCY_QUEUED = Gauge(
+    "concurrency_queued",
+    "Количество запросов класса, ожидающих в очереди",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+REQUESTS_SHED = Counter(
+    "requests_shed",
+    "Запросы, отклоненные с кодом 503 из-за перегрузки",
+    ["route_class", "reason"],
+)
+
+@contextmanager
+def observe(histogram, **labels):
+    """Замеряет время выполнения блока кода и записывает его в гистограмму.
+
+    Args:
+        histogram (Histogram): Гистограмма для записи.
+        **labels: Значения меток гистограммы.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric = histogram.labels(**labels) if labels else histogram
+        metric.observe(time.perf_counter() - start)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Слушатель команд pymongo, записывающий длительность каждой команды."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_LATENCY.labels(event.command_name, "success").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_LATENCY.labels(event.command_name, "failure").observe(event.duration_micros / 1e6)
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Слушатель пула соединений pymongo, считающий занятые соединения."""
+
+    def __init__(self):
+        self.checked_out = 0
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+        MONGO_POOL_CHECKED_OUT.set(self.checked_out)
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+        MONGO_POOL_CHECKED_OUT.set(self.checked_out)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+class MetricsMiddleware:
+    """ASGI middleware, замеряющее время обработки запросов по шаблону маршрута.
+
+    Шаблон (например, ``/task-groups/{group_name}``) берется из найденного
+    маршрута, поэтому количество меток не зависит от названий групп и задач.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - start)
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Периодически замеряет, насколько позже ожидаемого просыпается цикл событий.
+
+    Args:
+        interval (float): Интервал между замерами в секундах.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+def is_multiprocess() -> bool:
+    """Проверяет, собираются ли метрики по нескольким воркерам (задан PROMETHEUS_MULTIPROC_DIR)."""
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+def mark_worker_dead():
+    """Удаляет значения live-метрик текущего воркера при его остановке."""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(os.getpid())
+
+def metrics_response() -> Response:
+    """Возвращает текущие значения метрик в формате Prometheus, в режиме нескольких процессов - по всем воркерам.
+
+    Returns:
+        Response: Ответ с метриками.
+    """
+    registry = REGISTRY
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
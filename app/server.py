@@ -0,0 +1,67 @@
+import glob
+import os
+import tempfile
+
+import uvicorn
+
+from app.config import get_settings
+
+def default_workers() -> int:
+    """Возвращает количество ядер, доступных процессу.
+
+    Returns:
+        int: Количество доступных ядер.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def prepare_metrics_dir(workers: int):
+    """Готовит каталог метрик Prometheus для нескольких воркеров.
+
+    Без PROMETHEUS_MULTIPROC_DIR каждый воркер отдает на /metrics только свои
+    значения. Если переменная не задана и воркеров больше одного, создается
+    временный каталог; файлы прошлого запуска удаляются. Переменная
+    наследуется процессами воркеров.
+
+    Args:
+        workers (int): Количество воркеров.
+    """
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path is None:
+        if workers == 1:
+            return
+        path = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+    os.makedirs(path, exist_ok=True)
+    for file in glob.glob(os.path.join(path, "*.db")):
+        os.remove(file)
+
+def main():
+    """Запускает приложение в продакшн-режиме: несколько воркеров uvicorn с uvloop и httptools.
+
+    Настройки берутся из app.config:
+        HOST, PORT: Адрес и порт сервера.
+        WEB_CONCURRENCY: Количество воркеров, по умолчанию равно числу доступных ядер.
+        KEEPALIVE_TIMEOUT: Время жизни keep-alive соединения в секундах.
+        BACKLOG: Максимальная длина очереди входящих соединений.
+        GRACEFUL_SHUTDOWN_TIMEOUT: Время на завершение запросов при остановке в секундах.
+        PROMETHEUS_MULTIPROC_DIR: Каталог метрик воркеров, см. prepare_metrics_dir.
+    """
+    settings = get_settings()
+    workers = settings.web_concurrency or default_workers()
+    prepare_metrics_dir(workers)
+    uvicorn.run(
+        "app.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=settings.keepalive_timeout,
+        backlog=settings.backlog,
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout,
+        access_log=False,
+    )
+
+if __name__ == "__main__":
+    main()
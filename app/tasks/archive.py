@@ -0,0 +1,197 @@
+"""Архив выполненных и старых задач.
+
+Все задачи хранятся в документе пользователя, поэтому со временем он растет,
+а вместе с ним и время каждого запроса. Фоновый архиватор периодически
+переносит задачи, выполненные больше ARCHIVE_COMPLETED_AFTER секунд назад,
+и (если задано ARCHIVE_STALE_DAYS) задачи, созданные раньше этого срока,
+в коллекцию archived_tasks. Если задано ARCHIVE_TTL_DAYS, архивные задачи
+удаляются MongoDB по TTL индексу.
+
+Перенос идемпотентен: задача сначала сохраняется в архив по своему _id, затем
+удаляется из документа пользователя, поэтому архиватор можно запускать
+одновременно в нескольких воркерах.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, UTC
+from typing import Any
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from app import database
+from app.config import Settings, get_settings
+from . import counters, search
+
+logger = logging.getLogger(__name__)
+
+def is_archivable(task: dict[str, Any], completed_before: datetime, created_before: ObjectId | None) -> bool:
+    """Проверяет, нужно ли перенести задачу в архив.
+
+    Args:
+        task (dict[str, Any]): Задача.
+        completed_before (datetime): Задачи, выполненные до этого момента, переносятся.
+        created_before (ObjectId | None): Задачи с меньшим _id (созданные раньше) переносятся.
+
+    Returns:
+        bool: True, если задачу нужно перенести.
+    """
+    completed_at = task.get("completed_at")
+    if task.get("completed") and completed_at is not None:
+        if completed_at.tzinfo is None:
+            completed_at = completed_at.replace(tzinfo=UTC)
+        if completed_at <= completed_before:
+            return True
+    return created_before is not None and task["_id"] < created_before
+
+def archived_document(user_id: ObjectId, group: dict[str, Any], task: dict[str, Any], now: datetime) -> dict[str, Any]:
+    """Возвращает архивный документ задачи с названием группы на момент переноса.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        group (dict[str, Any]): Группа задач.
+        task (dict[str, Any]): Задача.
+        now (datetime): Время переноса в архив.
+
+    Returns:
+        dict[str, Any]: Документ коллекции archived_tasks.
+    """
+    return {
+        "user_id": user_id,
+        "group_id": group["_id"],
+        "group_title": group["title"],
+        "title": task["title"],
+        "description": task.get("description", ""),
+        "completed": task.get("completed", False),
+        "completed_at": task.get("completed_at"),
+        "archived_at": now,
+    }
+
+async def archive_user(
+        user: dict[str, Any], now: datetime, completed_before: datetime, created_before: ObjectId | None
+) -> int:
+    """Переносит подходящие задачи пользователя в архив.
+
+    Задачи, которые изменились между чтением и удалением из документа
+    (например, отметку о выполнении сняли), остаются у пользователя,
+    а их копии удаляются из архива.
+
+    Args:
+        user (dict[str, Any]): Документ пользователя с полем todo.
+        now (datetime): Время архивации.
+        completed_before (datetime): Граница для выполненных задач.
+        created_before (ObjectId | None): Граница для старых задач.
+
+    Returns:
+        int: Количество перенесенных задач.
+    """
+    requests, completed_ids, stale_ids = [], [], []
+    for group in user.get("todo", []):
+        for task in group["tasks"]:
+            if not is_archivable(task, completed_before, created_before):
+                continue
+            if created_before is not None and task["_id"] < created_before:
+                stale_ids.append(task["_id"])
+            else:
+                completed_ids.append(task["_id"])
+            requests.append(UpdateOne(
+                {"_id": task["_id"]},
+                {"$setOnInsert": archived_document(user["_id"], group, task, now)},
+                upsert=True,
+            ))
+    if not requests:
+        return 0
+
+    await database.archived_tasks.bulk_write(requests, ordered=False)
+    remaining = await database.users.find_one_and_update(
+        {"_id": user["_id"]},
+        {
+            "$pull": {"todo.$[].tasks": {"$or": [
+                {"_id": {"$in": completed_ids}, "completed": True},
+                {"_id": {"$in": stale_ids}},
+            ]}},
+            "$inc": {"rev": 1},
+        },
+        projection={"todo.tasks._id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+    archived_ids = completed_ids + stale_ids
+    if remaining is not None:
+        kept = {task["_id"] for group in remaining.get("todo", []) for task in group["tasks"]}
+        if kept.intersection(archived_ids):
+            await database.archived_tasks.delete_many({"_id": {"$in": list(kept.intersection(archived_ids))}})
+            archived_ids = [task_id for task_id in archived_ids if task_id not in kept]
+    # Задачи удаляются из нескольких групп сразу, поэтому счетчики проще пересчитать
+    await counters.recount_user(user["_id"])
+    await search.remove_tasks(archived_ids)
+    return len(archived_ids)
+
+def archive_query(settings: Settings, now: datetime) -> tuple[dict[str, Any], datetime, ObjectId | None]:
+    """Строит запрос пользователей с задачами для архивации и границы для archive_user.
+
+    Args:
+        settings (Settings): Настройки приложения.
+        now (datetime): Время архивации.
+
+    Returns:
+        tuple[dict[str, Any], datetime, ObjectId | None]: Фильтр пользователей,
+            граница для выполненных задач и граница для старых задач.
+    """
+    completed_before = now - timedelta(seconds=settings.archive_completed_after)
+    conditions = [{"todo.tasks.completed_at": {"$lte": completed_before}}]
+    created_before = None
+    if settings.archive_stale_days:
+        created_before = ObjectId.from_datetime(now - timedelta(days=settings.archive_stale_days))
+        conditions.append({"todo.tasks._id": {"$lt": created_before}})
+    return {"$or": conditions}, completed_before, created_before
+
+async def archive_once(settings: Settings) -> int:
+    """Переносит в архив задачи одной партии пользователей.
+
+    Args:
+        settings (Settings): Настройки приложения.
+
+    Returns:
+        int: Количество перенесенных задач.
+    """
+    now = datetime.now(UTC)
+    query, completed_before, created_before = archive_query(settings, now)
+
+    archived = 0
+    cursor = database.users.find(query, {"todo": 1}).limit(settings.archive_batch_size)
+    async for user in cursor:
+        archived += await archive_user(user, now, completed_before, created_before)
+    return archived
+
+async def run_archiver():
+    """Периодически переносит задачи в архив. Запускается в lifespan."""
+    settings = get_settings()
+    while True:
+        try:
+            archived = await archive_once(settings)
+            if archived:
+                logger.info("Archived %s tasks", archived)
+        except Exception:
+            # Ошибка в одном документе не должна останавливать архивацию до перезапуска воркера
+            logger.exception("Task archiving failed")
+        # Разброс интервала, чтобы воркеры не запускали архивацию одновременно
+        await asyncio.sleep(settings.archive_interval * random.uniform(0.9, 1.1))
+
+async def list_archived(user_id: ObjectId, page: int, size: int) -> list[dict[str, Any]]:
+    """Возвращает страницу архивных задач пользователя, начиная с последних.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        page (int): Номер страницы, начиная с 1.
+        size (int): Количество задач на странице.
+
+    Returns:
+        list[dict[str, Any]]: Архивные задачи.
+    """
+    cursor = database.archived_tasks.find(
+        {"user_id": user_id},
+        {"user_id": 0},
+    ).sort([("archived_at", -1), ("_id", -1)]).skip((page - 1) * size).limit(size)
+    return await cursor.to_list(length=size)
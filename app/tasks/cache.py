@@ -0,0 +1,168 @@
+"""Кеш сериализованных ответов с группами задач.
+
+Ключ содержит ревизию пользователя - поле rev, которое каждое изменение групп
+и задач в crud увеличивает на 1. Поэтому запись в кеше никогда не становится
+устаревшей: после изменения запрос идет по новому ключу, а старые записи
+вытесняются из LRU или истекают по TTL.
+
+Кеш двухуровневый: LRU в памяти процесса и необязательный общий уровень для
+всех воркеров и реплик (например, Redis при заданном RENDER_CACHE_URL).
+"""
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any, Protocol
+
+from app.config import get_settings
+from app.metrics import RENDER_CACHE_BYTES_SAVED, RENDER_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(Protocol):
+    """Общий уровень кеша."""
+
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        ...
+
+class InMemoryBackend:
+    """Общий уровень кеша в памяти процесса. Используется в тестах и бенчмарках."""
+
+    def __init__(self):
+        self.data: dict[str, tuple[bytes, float]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        self.data[key] = (value, time.monotonic() + ttl)
+
+class RedisBackend:
+    """Общий уровень кеша в Redis (нужен ``pip install redis``)."""
+
+    def __init__(self, url: str):
+        import redis.asyncio
+
+        self.client = redis.asyncio.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self.client.set(key, value, ex=ttl)
+
+class RenderCache:
+    """Двухуровневый кеш сериализованных ответов.
+
+    Args:
+        maxsize (int): Максимальное количество записей в памяти процесса.
+        backend (CacheBackend | None): Общий уровень кеша или None.
+        ttl (int): Время жизни записей общего уровня в секундах.
+    """
+
+    def __init__(self, maxsize: int, backend: CacheBackend | None = None, ttl: int = 300):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.ttl = ttl
+        self._local: OrderedDict[str, bytes] = OrderedDict()
+
+    async def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        """Возвращает ответ из кеша или сериализует его и сохраняет.
+
+        Ошибки общего уровня не прерывают запрос: ответ просто сериализуется заново.
+
+        Args:
+            key (str): Ключ записи.
+            render (Callable[[], bytes]): Функция сериализации ответа.
+
+        Returns:
+            bytes: Тело ответа.
+        """
+        value = self._local.get(key)
+        if value is not None:
+            self._local.move_to_end(key)
+            self._hit("local", value)
+            return value
+        RENDER_CACHE_REQUESTS.labels("local", "miss").inc()
+
+        if self.backend is not None:
+            try:
+                value = await self.backend.get(key)
+            except Exception:
+                logger.exception("Render cache backend get failed")
+            if value is not None:
+                self._hit("shared", value)
+                self._store_local(key, value)
+                return value
+            RENDER_CACHE_REQUESTS.labels("shared", "miss").inc()
+
+        value = render()
+        self._store_local(key, value)
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, value, self.ttl)
+            except Exception:
+                logger.exception("Render cache backend set failed")
+        return value
+
+    def clear(self):
+        """Очищает уровень кеша в памяти процесса."""
+        self._local.clear()
+
+    def _store_local(self, key: str, value: bytes):
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _hit(tier: str, value: bytes):
+        RENDER_CACHE_REQUESTS.labels(tier, "hit").inc()
+        RENDER_CACHE_BYTES_SAVED.inc(len(value))
+
+def cache_key(user: dict[str, Any], route: str, *parts: str) -> str:
+    """Строит ключ кеша для ответа пользователю.
+
+    Args:
+        user (dict[str, Any]): Документ пользователя с полем rev.
+        route (str): Название обработчика.
+        *parts (str): Параметры запроса, влияющие на ответ.
+
+    Returns:
+        str: Ключ кеша.
+    """
+    return ":".join(["render", str(user["_id"]), str(user.get("rev", 0)), route, *parts])
+
+_render_cache: RenderCache | None = None
+
+def get_render_cache() -> RenderCache:
+    """Возвращает кеш ответов процесса, создавая его по настройкам при первом вызове.
+
+    Returns:
+        RenderCache: Кеш ответов.
+    """
+    global _render_cache
+    if _render_cache is None:
+        settings = get_settings()
+        backend = RedisBackend(settings.render_cache_url) if settings.render_cache_url else None
+        _render_cache = RenderCache(settings.render_cache_size, backend, settings.render_cache_ttl)
+    return _render_cache
+
+def set_render_cache(cache: RenderCache | None):
+    """Заменяет кеш ответов процесса, например на кеш с InMemoryBackend в тестах.
+
+    Args:
+        cache (RenderCache | None): Новый кеш или None, чтобы создать его заново по настройкам.
+    """
+    global _render_cache
+    _render_cache = cache
@@ -0,0 +1,106 @@
+"""Счетчики групп и задач пользователя.
+
+В документе пользователя хранятся group_count и task_count, а в каждой группе -
+task_count. Функции crud изменяют их через ``$inc`` в тех же обновлениях, что
+создают, удаляют и переносят группы и задачи, поэтому сводка читается одним
+запросом без загрузки самих задач. Пересчет по данным отмечается полем
+counters_version: у документов без него (созданных до появления счетчиков)
+счетчики могли появиться от первого ``$inc`` и быть неверными, поэтому сводка
+пересчитывает их при первом чтении. Пересчет всех пользователей::
+
+    python -m app.tasks.counters repair
+"""
+import asyncio
+import sys
+from typing import Any
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app import database
+
+SUMMARY_PROJECTION = {
+    "counters_version": 1,
+    "group_count": 1,
+    "task_count": 1,
+    "todo._id": 1,
+    "todo.title": 1,
+    "todo.task_count": 1,
+}
+
+# Пересчитывает счетчики на стороне MongoDB одним обновлением
+RECOUNT_PIPELINE = [
+    {"$set": {"todo": {"$map": {
+        "input": {"$ifNull": ["$todo", []]},
+        "as": "group",
+        "in": {"$mergeObjects": ["$$group", {"task_count": {"$size": {"$ifNull": ["$$group.tasks", []]}}}]},
+    }}}},
+    {"$set": {
+        "group_count": {"$size": "$todo"},
+        "task_count": {"$sum": "$todo.task_count"},
+        "counters_version": database.COUNTERS_VERSION,
+    }},
+]
+
+def to_summary(user: dict[str, Any]) -> dict[str, Any]:
+    """Собирает сводку из полей документа пользователя, прочитанных с SUMMARY_PROJECTION.
+
+    Args:
+        user (dict[str, Any]): Документ пользователя.
+
+    Returns:
+        dict[str, Any]: Количество групп, задач и задач в каждой группе.
+    """
+    return {
+        "group_count": user["group_count"],
+        "task_count": user["task_count"],
+        "groups": user.get("todo", []),
+    }
+
+async def recount_user(user_id: ObjectId) -> dict[str, Any] | None:
+    """Пересчитывает счетчики пользователя по его группам и задачам.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+
+    Returns:
+        dict[str, Any] | None: Поля сводки после пересчета или None, если пользователь не найден.
+    """
+    return await database.users.find_one_and_update(
+        {"_id": user_id},
+        RECOUNT_PIPELINE,
+        projection=SUMMARY_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def get_summary(username: str) -> dict[str, Any] | None:
+    """Возвращает количество групп и задач пользователя, читая только счетчики.
+
+    Если счетчики пользователя еще не пересчитывались по данным, они пересчитываются.
+
+    Args:
+        username (str): Имя пользователя.
+
+    Returns:
+        dict[str, Any] | None: Сводка или None, если пользователь не найден.
+    """
+    user = await database.get_user_by_username(username, SUMMARY_PROJECTION)
+    if user is None:
+        return None
+    if user.get("counters_version") != database.COUNTERS_VERSION:
+        user = await recount_user(user["_id"])
+    return to_summary(user) if user is not None else None
+
+async def repair_all():
+    """Пересчитывает счетчики всех пользователей."""
+    database.connect()
+    try:
+        result = await database.users.update_many({}, RECOUNT_PIPELINE)
+    finally:
+        await database.disconnect()
+    print(f"Recounted {result.modified_count} users")
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["repair"]:
+        sys.exit("Usage: python -m app.tasks.counters repair")
+    asyncio.run(repair_all())
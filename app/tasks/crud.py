@@ -1,14 +1,19 @@
+from datetime import datetime, UTC
 from typing import Any, Dict
 
 from bson import ObjectId
 from fastapi.exceptions import HTTPException
 from pymongo.results import UpdateResult
 
-from app.database import users
+from app import database
+from . import ranking, search
+
+# Служебные маршруты находятся под /task-groups/-/..., поэтому группа не может так называться
+RESERVED_GROUP_NAME = "-"
 
 async def create_task_group(user: dict[str, Any], group_name: str):
     """
-    Создает новую группу задач с автоматически увеличенным order_num.
+    Создает новую группу задач в конце списка групп.
     Возвращает результат обновления MongoDB.
 
     Args:
@@ -19,41 +24,116 @@ async def create_task_group(user: dict[str, Any], group_name: str):
         dict: Результат операции с идентификатором созданной группы задач.
 
     Raises:
-        HTTPException: Если имя группы не является строкой или уже существует.
+        HTTPException: Если имя группы не является строкой, зарезервировано, уже существует
+            или группы изменились во время создания.
     """
     if not group_name or not isinstance(group_name, str):
         raise HTTPException(status_code=400, detail="Group name must be a non-empty string")
+    if group_name == RESERVED_GROUP_NAME:
+        raise HTTPException(status_code=400, detail=f"Group name '{RESERVED_GROUP_NAME}' is reserved")
 
     if get_task_group(user, group_name) is not None:
         raise HTTPException(status_code=409, detail=f"Task group '{group_name}' already exists")
 
+    await ensure_ranks(user)
+
     new_group_id = ObjectId()
 
-    user_doc = await users.find_one({"_id": user["_id"]}, {"todo.order_num": 1})
+    user_doc = await database.users.find_one({"_id": user["_id"]}, {"todo.rank": 1})
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found")
 
-    max_order_num = max([t.get("order_num", 0) for t in user_doc.get("todo", [])] or [0])
-    new_order_num = max_order_num + 1
+    last_rank = max((g["rank"] for g in user_doc.get("todo", []) if "rank" in g), default=None)
+    new_rank = ranking.rank_between(last_rank, None)
 
-    result: UpdateResult = await users.update_one(
-        {"_id": user["_id"]},
+    # Запись только если никто не добавил группу с таким же или большим ключом после чтения
+    result: UpdateResult = await database.users.update_one(
+        {"_id": user["_id"], "todo": {"$not": {"$elemMatch": {"rank": {"$gte": new_rank}}}}},
         {
             "$push": {
                 "todo": {
                     "_id": new_group_id,
                     "title": group_name,
-                    "order_num": new_order_num,
+                    "rank": new_rank,
+                    "task_count": 0,
                     "tasks": []
                 }
-            }
+            },
+            "$inc": {"rev": 1, "group_count": 1},
         }
     )
 
     if result.modified_count == 1:
+        ranking.schedule_rebalance(new_rank, user["_id"])
+        await search.index_group(user["_id"], new_group_id, group_name)
         return {"Result": "success", "task_group_id": str(new_group_id)}
     else:
-        raise HTTPException(status_code=500, detail="Failed to create task group")
+        raise HTTPException(status_code=409, detail="Task groups changed concurrently, retry the request")
+
+def new_rank_between(
+        lower: str | None, upper: str | None, user_id: ObjectId, group_id: ObjectId | None = None
+) -> str:
+    """Возвращает ключ между соседями, а при одинаковых ключах соседей запускает перенумерацию.
+
+    Args:
+        lower (str | None): Ключ предыдущего элемента.
+        upper (str | None): Ключ следующего элемента.
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId | None): Идентификатор группы для задач или None для групп.
+
+    Returns:
+        str: Новый ключ.
+
+    Raises:
+        HTTPException: Если между соседями нет ключа; запрос можно повторить после перенумерации.
+    """
+    try:
+        return ranking.rank_between(lower, upper)
+    except ValueError:
+        ranking.start_rebalance(user_id, group_id)
+        raise HTTPException(status_code=409, detail="Order is being repaired, retry the request")
+
+async def ensure_ranks(user: dict[str, Any]):
+    """
+    Переводит группы и задачи пользователя со старого order_num на rank, если это еще не сделано.
+
+    Args:
+        user (dict[str, Any]): Информация о пользователе. Поле todo обновляется на месте.
+
+    Raises:
+        HTTPException: Если группы изменились во время перевода.
+    """
+    if ranking.needs_migration(user) and not await ranking.migrate_user(user):
+        raise HTTPException(status_code=409, detail="Task groups were modified concurrently, retry the request")
+
+def ordered_task_groups(user: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    Возвращает группы пользователя и их задачи в порядке rank с порядковыми номерами order_num.
+
+    Args:
+        user (dict[str, Any]): Информация о пользователе.
+
+    Returns:
+        list[dict[str, Any]]: Упорядоченные группы задач.
+    """
+    return [{**group, "tasks": ranking.ordered(group["tasks"])} for group in ranking.ordered(user["todo"])]
+
+def ordered_task_group(user: dict[str, Any], group: dict[str, Any]) -> dict[str, Any]:
+    """
+    Возвращает группу с ее порядковым номером среди групп пользователя и упорядоченными задачами.
+
+    Args:
+        user (dict[str, Any]): Информация о пользователе.
+        group (dict[str, Any]): Группа задач пользователя.
+
+    Returns:
+        dict[str, Any]: Упорядоченная группа задач.
+    """
+    return {
+        **group,
+        "order_num": ranking.position(user["todo"], group),
+        "tasks": ranking.ordered(group["tasks"]),
+    }
 
 def get_task(task_group: dict[str, Any], task_name: str) -> dict[str, Any]:
     """
@@ -89,7 +169,8 @@ def get_task_group(user, group_name):
 
 async def delete_task_group(user: dict[str, Any], group_name: str) -> Dict[str, str]:
     """
-    Удаляет группу задач по названию и обновляет порядковые номера оставшихся групп.
+    Удаляет группу задач по названию. Порядок остальных групп задается их rank,
+    поэтому другие группы не изменяются.
     Возвращает сообщение об успехе или выбрасывает соответствующее исключение HTTPException.
 
     Args:
@@ -102,47 +183,77 @@ async def delete_task_group(user: dict[str, Any], group_name: str) -> Dict[str,
     Raises:
         HTTPException: Если группа не найдена или операция не удалась.
     """
+    group = get_task_group(user, group_name)
+    if group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    task_count = len(group["tasks"])
     try:
-        user_doc = await users.find_one(
-            {"_id": user["_id"], "todo.title": group_name},
-            {"todo.$": 1}
+        # Условие на размер списка задач, чтобы счетчик task_count уменьшился ровно на число удаленных задач
+        delete_result = await database.users.update_one(
+            {"_id": user["_id"], "todo": {"$elemMatch": {"_id": group["_id"], "tasks": {"$size": task_count}}}},
+            {
+                "$pull": {"todo": {"_id": group["_id"]}},
+                "$inc": {"rev": 1, "group_count": -1, "task_count": -task_count},
+            }
         )
 
-        if not user_doc or not user_doc.get("todo"):
-            raise HTTPException(status_code=404, detail="Group not found")
+        if delete_result.modified_count != 1:
+            raise HTTPException(status_code=409, detail="Group was deleted or modified concurrently")
 
-        deleted_order = user_doc["todo"][0]["order_num"]
+        await search.remove_group(group["_id"])
+        return {"Result": "success"}
 
-        delete_result = await users.update_one(
-            {"_id": user["_id"]},
-            {"$pull": {"todo": {"title": group_name}}}
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database operation failed: {str(e)}")
 
-        if delete_result.modified_count != 1:
-            raise HTTPException(status_code=404, detail="Group not found or already deleted")
+async def move_task_group(
+        user: dict[str, Any], group_name: str, after: str | None = None, before: str | None = None
+) -> Dict[str, str]:
+    """
+    Перемещает группу задач после группы after или перед группой before,
+    а если ни одна не указана - в конец списка. Изменяется только rank перемещаемой группы.
 
-        user_groups = await users.find_one({"_id": user["_id"]}, {"todo": 1})
+    Args:
+        user (dict[str, Any]): Информация о пользователе.
+        group_name (str): Название перемещаемой группы задач.
+        after (str | None): Название группы, после которой нужно поставить группу.
+        before (str | None): Название группы, перед которой нужно поставить группу.
 
-        updated_todo = []
-        for group in user_groups["todo"]:
-            if group["order_num"] > deleted_order:
-                group["order_num"] -= 1
-            updated_todo.append(group)
+    Returns:
+        dict: Сообщение об успешном перемещении.
 
-        update_result = await users.update_one(
-            {"_id": user["_id"]},
-            {"$set": {"todo": updated_todo}}
-        )
+    Raises:
+        HTTPException: Если параметры некорректны, группы не найдены или операция не удалась.
+    """
+    if after is not None and before is not None:
+        raise HTTPException(status_code=400, detail="Specify either 'after' or 'before', not both")
+    if group_name in (after, before):
+        raise HTTPException(status_code=400, detail="Group cannot be moved relative to itself")
 
-        if update_result.modified_count == 1:
-            return {"Result": "success"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to update task groups order")
+    await ensure_ranks(user)
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database operation failed: {str(e)}")
+    group = get_task_group(user, group_name)
+    if group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    try:
+        lower, upper = ranking.neighbour_ranks(user["todo"], group["_id"], after, before)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=f"Group '{e}' not found")
+    new_rank = new_rank_between(lower, upper, user["_id"])
+
+    result = await database.users.update_one(
+        {"_id": user["_id"], "todo._id": group["_id"]},
+        {"$set": {"todo.$.rank": new_rank}, "$inc": {"rev": 1}}
+    )
+
+    if result.matched_count != 1:
+        raise HTTPException(status_code=404, detail="Group not found")
+    ranking.schedule_rebalance(new_rank, user["_id"])
+    return {"Result": "success"}
 
 async def rename_task_group(user: dict[str, Any], old_group_name: str, new_group_name: str) -> Dict[str, str]:
     """
@@ -160,15 +271,17 @@ async def rename_task_group(user: dict[str, Any], old_group_name: str, new_group
         dict: Сообщение об успешном переименовании.
 
     Raises:
-        HTTPException: Если имена пустые, совпадают или операция не удалась.
+        HTTPException: Если имена пустые, совпадают, новое имя зарезервировано или операция не удалась.
     """
     if not old_group_name or not new_group_name:
         raise HTTPException(status_code=400, detail="Group names cannot be empty")
     if old_group_name == new_group_name:
         raise HTTPException(status_code=400, detail="New name must be different from old name")
+    if new_group_name == RESERVED_GROUP_NAME:
+        raise HTTPException(status_code=400, detail=f"Group name '{RESERVED_GROUP_NAME}' is reserved")
 
     try:
-        existing_group = await users.find_one({
+        existing_group = await database.users.find_one({
             "_id": user["_id"],
             "todo.title": new_group_name
         })
@@ -176,12 +289,15 @@ async def rename_task_group(user: dict[str, Any], old_group_name: str, new_group
         if existing_group:
             raise HTTPException(status_code=409, detail=f"Group '{new_group_name}' already exists")
 
-        result = await users.update_one(
+        result = await database.users.update_one(
             {"_id": user["_id"], "todo.title": old_group_name},
-            {"$set": {"todo.$.title": new_group_name}}
+            {"$set": {"todo.$.title": new_group_name}, "$inc": {"rev": 1}}
         )
 
         if result.modified_count == 1:
+            group = get_task_group(user, old_group_name)
+            if group is not None:
+                await search.rename_group(group["_id"], new_group_name)
             return {"Result": "success"}
         else:
             raise HTTPException(status_code=404, detail=f"Group '{old_group_name}' not found")
@@ -203,7 +319,8 @@ async def create_task(user: dict[str, Any], group_name: str, task_name: str, des
         dict: Сообщение об успешном создании задачи с идентификатором задачи.
 
     Raises:
-        HTTPException: Если название задачи не является строкой или задача уже существует.
+        HTTPException: Если название задачи не является строкой, задача уже существует
+            или группа изменилась во время создания.
     """
     if not task_name or not isinstance(task_name, str):
         raise HTTPException(status_code=400, detail="Task name must be a non-empty string")
@@ -215,32 +332,38 @@ async def create_task(user: dict[str, Any], group_name: str, task_name: str, des
     if get_task(group, task_name) is not None:
         raise HTTPException(status_code=409, detail=f"Task '{task_name}' already exists")
 
-    new_task_id = ObjectId()
+    await ensure_ranks(user)
+    group = get_task_group(user, group_name)
 
-    new_order_num = max(t["order_num"] for t in group["tasks"]) + 1 if group["tasks"] else 1
+    new_task_id = ObjectId()
 
-    result: UpdateResult = await users.update_one(
-        {"_id": user["_id"], "todo.title": group_name},
-        {
-            "$push": {
-                "todo.$.tasks": {
-                    "_id": new_task_id,
-                    "title": task_name,
-                    "description": description,
-                    "order_num": new_order_num,
-                }
-            }
-        }
+    new_rank = ranking.rank_between(max((t["rank"] for t in group["tasks"]), default=None), None)
+    new_task = {
+        "_id": new_task_id,
+        "title": task_name,
+        "description": description,
+        "rank": new_rank,
+    }
+
+    # Запись только если никто не добавил задачу с таким же или большим ключом после чтения
+    result: UpdateResult = await database.users.update_one(
+        {"_id": user["_id"], "todo": {"$elemMatch": {
+            "_id": group["_id"],
+            "tasks": {"$not": {"$elemMatch": {"rank": {"$gte": new_rank}}}},
+        }}},
+        {"$push": {"todo.$.tasks": new_task}, "$inc": {"rev": 1, "task_count": 1, "todo.$.task_count": 1}}
     )
 
     if result.modified_count == 1:
+        ranking.schedule_rebalance(new_rank, user["_id"], group["_id"])
+        await search.index_task(user["_id"], group["_id"], new_task)
         return {"Result": "success", "task_id": str(new_task_id)}
     else:
-        raise HTTPException(status_code=500, detail="Failed to create task")
+        raise HTTPException(status_code=409, detail="Group changed concurrently, retry the request")
 
 async def delete_task(user: dict[str, Any], group_name: str, task_name: str) -> Dict[str, str]:
     """
-    Удаляет задачу из указанной группы задач и обновляет порядковые номера оставшихся задач.
+    Удаляет задачу из указанной группы задач. Остальные задачи не изменяются.
 
     Args:
         user (dict[str, Any]): Информация о пользователе.
@@ -261,27 +384,145 @@ async def delete_task(user: dict[str, Any], group_name: str, task_name: str) ->
     if task_to_delete is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    result = await users.update_one(
-        {"_id": user["_id"], "todo.title": group_name},
-        {"$pull": {"todo.$.tasks": {"title": task_name}}}
+    result = await database.users.update_one(
+        {"_id": user["_id"], "todo": {"$elemMatch": {"_id": task_group["_id"], "tasks._id": task_to_delete["_id"]}}},
+        {
+            "$pull": {"todo.$.tasks": {"_id": task_to_delete["_id"]}},
+            "$inc": {"rev": 1, "task_count": -1, "todo.$.task_count": -1},
+        }
     )
 
     if result.modified_count == 1:
-        updated_tasks = []
-        for task in task_group["tasks"]:
-            if task["title"] != task_name:
-                if task["order_num"] > task_to_delete["order_num"]:
-                    task["order_num"] -= 1
-                updated_tasks.append(task)
-
-        update_result = await users.update_one(
-            {"_id": user["_id"], "todo.title": group_name},
-            {"$set": {"todo.$.tasks": updated_tasks}}
-        )
+        await search.remove_task(task_to_delete["_id"])
+        return {"Result": "success"}
+    else:
+        raise HTTPException(status_code=404, detail="Task not found or already deleted")
 
-        if update_result.modified_count == 1:
-            return {"Result": "success"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to update tasks order")
+async def set_task_completed(
+        user: dict[str, Any], group_name: str, task_name: str, completed: bool
+) -> Dict[str, str]:
+    """
+    Отмечает задачу выполненной или снимает отметку. Выполненные задачи
+    через некоторое время переносятся архиватором в архив.
+
+    Args:
+        user (dict[str, Any]): Информация о пользователе.
+        group_name (str): Название группы задач.
+        task_name (str): Название задачи.
+        completed (bool): Выполнена ли задача.
+
+    Returns:
+        dict: Сообщение об успешном изменении.
+
+    Raises:
+        HTTPException: Если группа или задача не найдены.
+    """
+    group = get_task_group(user, group_name)
+    if group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    task = get_task(group, task_name)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task.get("completed", False) == completed:
+        return {"Result": "success"}
+
+    prefix = "todo.$[group].tasks.$[task]"
+    if completed:
+        update = {"$set": {f"{prefix}.completed": True, f"{prefix}.completed_at": datetime.now(UTC)}}
+    else:
+        update = {"$set": {f"{prefix}.completed": False}, "$unset": {f"{prefix}.completed_at": ""}}
+    result = await database.users.update_one(
+        {"_id": user["_id"]},
+        {**update, "$inc": {"rev": 1}},
+        array_filters=[{"group._id": group["_id"]}, {"task._id": task["_id"]}],
+    )
+
+    if result.matched_count != 1:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {"Result": "success"}
+
+async def move_task(
+        user: dict[str, Any],
+        group_name: str,
+        task_name: str,
+        to_group: str | None = None,
+        after: str | None = None,
+        before: str | None = None,
+) -> Dict[str, str]:
+    """
+    Перемещает задачу после задачи after или перед задачей before, а если ни одна
+    не указана - в конец группы. Задачу можно перенести в другую группу to_group.
+    Выполняется одним обновлением MongoDB, остальные задачи не изменяются.
+
+    Args:
+        user (dict[str, Any]): Информация о пользователе.
+        group_name (str): Название текущей группы задачи.
+        task_name (str): Название задачи.
+        to_group (str | None): Название группы, в которую нужно перенести задачу.
+        after (str | None): Название задачи, после которой нужно поставить задачу.
+        before (str | None): Название задачи, перед которой нужно поставить задачу.
+
+    Returns:
+        dict: Сообщение об успешном перемещении.
+
+    Raises:
+        HTTPException: Если параметры некорректны, группы или задачи не найдены или операция не удалась.
+    """
+    if after is not None and before is not None:
+        raise HTTPException(status_code=400, detail="Specify either 'after' or 'before', not both")
+    if task_name in (after, before):
+        raise HTTPException(status_code=400, detail="Task cannot be moved relative to itself")
+
+    await ensure_ranks(user)
+
+    source = get_task_group(user, group_name)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    task = get_task(source, task_name)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    target = source if to_group is None else get_task_group(user, to_group)
+    if target is None:
+        raise HTTPException(status_code=404, detail=f"Group '{to_group}' not found")
+    if target is not source and get_task(target, task_name) is not None:
+        raise HTTPException(status_code=409, detail=f"Task '{task_name}' already exists in '{to_group}'")
+
+    try:
+        lower, upper = ranking.neighbour_ranks(target["tasks"], task["_id"], after, before)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=f"Task '{e}' not found")
+    new_rank = new_rank_between(lower, upper, user["_id"], target["_id"])
+
+    if target is source:
+        result = await database.users.update_one(
+            {"_id": user["_id"]},
+            {"$set": {"todo.$[group].tasks.$[task].rank": new_rank}, "$inc": {"rev": 1}},
+            array_filters=[{"group._id": source["_id"]}, {"task._id": task["_id"]}],
+        )
     else:
-        raise HTTPException(status_code=500, detail="Failed to delete task")
+        # Без проверки целевой группы удаленная за это время группа потеряла бы задачу:
+        # $pull выполнился бы, а $push ни с чем не совпал
+        result = await database.users.update_one(
+            {"_id": user["_id"], "$and": [
+                {"todo": {"$elemMatch": {"_id": source["_id"], "tasks._id": task["_id"]}}},
+                {"todo": {"$elemMatch": {"_id": target["_id"], "tasks.title": {"$ne": task["title"]}}}},
+            ]},
+            {
+                "$pull": {"todo.$[source].tasks": {"_id": task["_id"]}},
+                "$push": {"todo.$[target].tasks": {**task, "rank": new_rank}},
+                "$inc": {"rev": 1, "todo.$[source].task_count": -1, "todo.$[target].task_count": 1},
+            },
+            array_filters=[{"source._id": source["_id"]}, {"target._id": target["_id"]}],
+        )
+        if result.matched_count != 1:
+            raise HTTPException(
+                status_code=409, detail="Task or target group changed concurrently, retry the request"
+            )
+
+    if result.matched_count != 1:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if target is not source:
+        await search.move_task(task["_id"], target["_id"])
+    ranking.schedule_rebalance(new_rank, user["_id"], target["_id"])
+    return {"Result": "success"}
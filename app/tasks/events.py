@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app import database
+from app.metrics import SSE_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 32
+RETRY_DELAY = 1.0
+# $changeStream на сервере без replica set
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+RESYNC = {"type": "resync"}
+
+class ChangeFeed:
+    """Раздает изменения групп и задач пользователей подписчикам.
+
+    На процесс открывается один change stream коллекции users, независимо от
+    числа подписчиков. Каждый подписчик получает ограниченную очередь: если
+    клиент не успевает читать события, очередь очищается и в нее кладется
+    событие ``resync``, после которого клиент должен заново запросить группы.
+    Change streams требуют replica set (для разработки достаточно одного узла);
+    без него чтение не возобновляется, а подписчики получают только keep-alive.
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[ObjectId, set[asyncio.Queue]] = defaultdict(set)
+        self._watcher: asyncio.Task | None = None
+        self.unsupported = False
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: ObjectId):
+        """Подписывает на изменения пользователя на время контекста.
+
+        Args:
+            user_id (ObjectId): Идентификатор пользователя.
+
+        Yields:
+            asyncio.Queue: Очередь событий пользователя.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        SSE_SUBSCRIBERS.inc()
+        if not self.unsupported and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._watch())
+        try:
+            yield queue
+        finally:
+            SSE_SUBSCRIBERS.dec()
+            queues = self._subscribers[user_id]
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def close(self):
+        """Останавливает чтение change stream."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self):
+        """Читает change stream и переподключается с последнего resume token при ошибках."""
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}},
+            {"$project": {
+                "operationType": 1,
+                "documentKey": 1,
+                "updateDescription": 1,
+                "fullDocument.rev": 1,
+                "fullDocument.todo._id": 1,
+                "fullDocument.todo.tasks._id": 1,
+            }},
+        ]
+        resume_token = None
+        while True:
+            try:
+                async with await database.users.watch(
+                        pipeline, full_document="updateLookup", resume_after=resume_token
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._publish(change)
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_UNSUPPORTED:
+                    # Повтор не поможет: без replica set клиенты продолжат получать только keep-alive
+                    logger.error("Change streams require a replica set, task events are disabled")
+                    self.unsupported = True
+                    return
+                logger.exception("Change stream failed, reconnecting")
+                for queues in self._subscribers.values():
+                    for queue in queues:
+                        self._put(queue, RESYNC)
+                await asyncio.sleep(RETRY_DELAY)
+
+    def _publish(self, change: dict):
+        """Передает изменение подписчикам пользователя, если они есть.
+
+        Args:
+            change (dict): Событие change stream.
+        """
+        queues = self._subscribers.get(change["documentKey"]["_id"])
+        if not queues:
+            return
+
+        event = to_event(change)
+        if event is None:
+            return
+        for queue in queues:
+            self._put(queue, event)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: dict):
+        """Кладет событие в очередь, заменяя ее содержимое на resync при переполнении.
+
+        Args:
+            queue (asyncio.Queue): Очередь подписчика.
+            event (dict): Событие.
+        """
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            event = RESYNC
+        queue.put_nowait(event)
+
+def to_event(change: dict) -> dict | None:
+    """Преобразует событие change stream в изменение групп и задач.
+
+    Порядок групп и задач задается полем rank, а не позицией в массиве, поэтому
+    индексы в путях полей заменяются идентификаторами: ``todo.<индекс>.tasks.<индекс>``
+    становится ``todo.<id группы>.tasks.<id задачи>``. Идентификаторы берутся из
+    версии документа на момент чтения (updateLookup), поэтому они верны, только если
+    после изменения документ не менялся: каждое изменение увеличивает rev, и если rev
+    в изменении и в документе различаются или путь восстановить нельзя, отправляется resync.
+    Изменения полей вне ``todo`` не передаются.
+
+    Args:
+        change (dict): Событие change stream.
+
+    Returns:
+        dict | None: Изменение для клиента или None, если группы и задачи не менялись.
+    """
+    if change["operationType"] != "update" or change.get("fullDocument") is None:
+        return RESYNC
+
+    todo = change["fullDocument"].get("todo", [])
+    description = change["updateDescription"]
+    updated_fields = description.get("updatedFields", {})
+    updated = {k: v for k, v in updated_fields.items() if k.startswith("todo")}
+    removed = [k for k in description.get("removedFields", []) if k.startswith("todo")]
+    truncated = [t for t in description.get("truncatedArrays", []) if t["field"].startswith("todo")]
+    if not (updated or removed or truncated):
+        return None
+    if "rev" not in updated_fields or updated_fields["rev"] != change["fullDocument"].get("rev"):
+        # Документ изменился после этого изменения: индексы могут указывать на другие группы
+        return RESYNC
+
+    try:
+        updated = {_resolve_path(k, todo): v for k, v in updated.items()}
+        removed = [_resolve_path(k, todo) for k in removed]
+        truncated = [{**t, "field": _resolve_path(t["field"], todo)} for t in truncated]
+    except IndexError:
+        return RESYNC
+    return {"type": "update", "updated": updated, "removed": removed, "truncated": truncated}
+
+def _resolve_path(path: str, todo: list[dict]) -> str:
+    """Заменяет индексы групп и задач в пути поля их идентификаторами.
+
+    Args:
+        path (str): Путь поля, например ``todo.2.tasks.0.rank``.
+        todo (list[dict]): Группы документа с идентификаторами групп и задач.
+
+    Returns:
+        str: Путь с идентификаторами.
+
+    Raises:
+        IndexError: Если в документе нет группы или задачи с таким индексом.
+    """
+    parts = path.split(".")
+    if len(parts) > 1 and parts[1].isdigit():
+        group = todo[int(parts[1])]
+        parts[1] = str(group["_id"])
+        if len(parts) > 3 and parts[2] == "tasks" and parts[3].isdigit():
+            parts[3] = str(group.get("tasks", [])[int(parts[3])]["_id"])
+    return ".".join(parts)
+
+def format_sse(event: dict) -> str:
+    """Форматирует событие для Server-Sent Events.
+
+    Args:
+        event (dict): Событие.
+
+    Returns:
+        str: Сообщение в формате text/event-stream.
+    """
+    data = {k: v for k, v in event.items() if k != "type"}
+    return f"event: {event['type']}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+
+change_feed = ChangeFeed()
@@ -1,6 +1,8 @@
+from datetime import datetime
 from typing import Annotated
 from typing import Any
 from typing import List
+from typing import Literal
 
 from bson import ObjectId
 from pydantic import BaseModel, Field
@@ -78,6 +80,8 @@ class Task(BaseModel):
     title: str
     description: str
     order_num: int
+    completed: bool = False
+    completed_at: datetime | None = None
 
 class GetTaskGroup(BaseModel):
     """Модель группы задач, представляющая группу задач в системе."""
@@ -96,3 +100,35 @@ class TaskGroupCreate(BaseModel):
 class TaskCreate(BaseModel):
     """Модель для создания задачи."""
     description: str = ""
+
+class SearchHit(BaseModel):
+    """Модель результата поиска: группа задач или задача."""
+    id: Annotated[ObjectId, ObjectIdPydanticAnnotation] = Field(alias="_id")
+    kind: Literal["group", "task"]
+    group_id: Annotated[ObjectId, ObjectIdPydanticAnnotation]
+    title: str
+    description: str | None = None
+    score: float
+
+class GroupSummary(BaseModel):
+    """Модель количества задач в группе."""
+    id: Annotated[ObjectId, ObjectIdPydanticAnnotation] = Field(alias="_id")
+    title: str
+    task_count: int
+
+class TaskSummary(BaseModel):
+    """Модель сводки по группам и задачам пользователя."""
+    group_count: int
+    task_count: int
+    groups: List[GroupSummary]
+
+class ArchivedTask(BaseModel):
+    """Модель задачи, перенесенной в архив."""
+    id: Annotated[ObjectId, ObjectIdPydanticAnnotation] = Field(alias="_id")
+    group_id: Annotated[ObjectId, ObjectIdPydanticAnnotation]
+    group_title: str
+    title: str
+    description: str
+    completed: bool = False
+    completed_at: datetime | None = None
+    archived_at: datetime
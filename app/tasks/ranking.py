@@ -0,0 +1,280 @@
+"""Порядок групп и задач на основе лексикографических ключей.
+
+Каждая группа и задача хранит строковый ключ rank, порядок определяется
+сортировкой по нему. Чтобы переместить элемент, достаточно выдать ему ключ
+между ключами соседей и обновить только этот элемент. Ключи - дробная часть
+числа в системе счисления по основанию 62 без завершающих нулей, поэтому
+между любыми двумя ключами всегда есть еще один.
+
+Когда ключи становятся слишком длинными, список в фоне перенумеровывается
+равномерно распределенными короткими ключами. Перевод данных со старого
+поля order_num::
+
+    python -m app.tasks.ranking migrate
+"""
+import asyncio
+import logging
+import sys
+from typing import Any
+
+from bson import ObjectId
+
+from app import database
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+MAX_RANK_LENGTH = 12
+
+logger = logging.getLogger(__name__)
+
+_background: set[asyncio.Task] = set()
+
+def rank_between(lower: str | None, upper: str | None) -> str:
+    """Возвращает ключ строго между lower и upper.
+
+    Args:
+        lower (str | None): Ключ предыдущего элемента или None, если элемент первый.
+        upper (str | None): Ключ следующего элемента или None, если элемент последний.
+
+    Returns:
+        str: Новый ключ.
+
+    Raises:
+        ValueError: Если lower не меньше upper (например, соседи получили одинаковые ключи).
+    """
+    if lower is not None and upper is not None and lower >= upper:
+        raise ValueError(f"Rank {lower!r} is not less than {upper!r}")
+    if upper is None and lower:
+        return _rank_after(lower)
+
+    lower = lower or ""
+    result = []
+    i = 0
+    while True:
+        lo = DIGITS.index(lower[i]) if i < len(lower) else 0
+        hi = DIGITS.index(upper[i]) if upper is not None else BASE
+        if hi - lo > 1:
+            result.append(DIGITS[(lo + hi) // 2])
+            return "".join(result)
+        result.append(DIGITS[lo])
+        if hi - lo == 1:
+            # Префикс уже меньше upper, дальше ограничение сверху не действует
+            upper = None
+        i += 1
+
+def _rank_after(lower: str) -> str:
+    """Возвращает ключ сразу после lower, увеличивая первую неполную цифру.
+
+    В отличие от середины интервала, ключ удлиняется на один символ только
+    раз в BASE добавлений в конец списка.
+
+    Args:
+        lower (str): Ключ последнего элемента.
+
+    Returns:
+        str: Новый ключ.
+    """
+    for i, digit in enumerate(lower):
+        if digit != DIGITS[-1]:
+            return lower[:i] + DIGITS[DIGITS.index(digit) + 1]
+    return lower + DIGITS[1]
+
+def spread_ranks(count: int) -> list[str]:
+    """Возвращает count коротких ключей, равномерно распределенных по всему диапазону.
+
+    Args:
+        count (int): Количество ключей.
+
+    Returns:
+        list[str]: Возрастающие ключи.
+    """
+    width = 1
+    while BASE ** width < (count + 1) * BASE:
+        width += 1
+    step = BASE ** width // (count + 1)
+    ranks = []
+    for i in range(1, count + 1):
+        value, digits = i * step, []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        ranks.append("".join(reversed(digits)).rstrip(DIGITS[0]))
+    return ranks
+
+def sort_key(item: dict[str, Any]):
+    """Ключ сортировки группы или задачи. Элементы без rank упорядочиваются по старому order_num."""
+    return item.get("rank", ""), item.get("order_num", 0)
+
+def ordered(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Сортирует группы или задачи по rank и проставляет order_num - позицию, начиная с 1.
+
+    Args:
+        items (list[dict[str, Any]]): Группы или задачи.
+
+    Returns:
+        list[dict[str, Any]]: Новый отсортированный список копий элементов.
+    """
+    return [{**item, "order_num": i} for i, item in enumerate(sorted(items, key=sort_key), start=1)]
+
+def position(items: list[dict[str, Any]], item: dict[str, Any]) -> int:
+    """Возвращает позицию элемента в отсортированном списке, начиная с 1.
+
+    Args:
+        items (list[dict[str, Any]]): Группы или задачи.
+        item (dict[str, Any]): Элемент из items.
+
+    Returns:
+        int: Порядковый номер элемента.
+    """
+    key = sort_key(item)
+    return 1 + sum(1 for other in items if sort_key(other) < key)
+
+def neighbour_ranks(
+        items: list[dict[str, Any]], moving_id: ObjectId | None, after: str | None, before: str | None
+) -> tuple[str | None, str | None]:
+    """Находит ключи соседей для новой позиции элемента.
+
+    Args:
+        items (list[dict[str, Any]]): Группы или задачи списка, в который ставится элемент.
+        moving_id (ObjectId | None): Идентификатор перемещаемого элемента, он не считается соседом.
+        after (str | None): Название элемента, после которого нужно поставить.
+        before (str | None): Название элемента, перед которым нужно поставить.
+            Если не заданы ни after, ни before, элемент ставится в конец.
+
+    Returns:
+        tuple[str | None, str | None]: Ключи предыдущего и следующего элементов.
+
+    Raises:
+        LookupError: Если элемент с названием after или before не найден.
+    """
+    others = sorted((item for item in items if item["_id"] != moving_id), key=sort_key)
+    ranks = [item["rank"] for item in others]
+    if after is None and before is None:
+        return (ranks[-1] if ranks else None), None
+
+    anchor = after if after is not None else before
+    for i, item in enumerate(others):
+        if item["title"] == anchor:
+            position = i + 1 if after is not None else i
+            break
+    else:
+        raise LookupError(anchor)
+    lower = ranks[position - 1] if position > 0 else None
+    upper = ranks[position] if position < len(ranks) else None
+    return lower, upper
+
+def needs_migration(user: dict[str, Any]) -> bool:
+    """Проверяет, есть ли у пользователя группы или задачи без rank.
+
+    Args:
+        user (dict[str, Any]): Документ пользователя.
+
+    Returns:
+        bool: True, если данные нужно перевести с order_num на rank.
+    """
+    return any(
+        "rank" not in group or any("rank" not in task for task in group["tasks"])
+        for group in user.get("todo", [])
+    )
+
+def _reranked(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Выдает элементам короткие ключи в текущем порядке и убирает order_num."""
+    result = []
+    for item, rank in zip(sorted(items, key=sort_key), spread_ranks(len(items))):
+        item = {k: v for k, v in item.items() if k != "order_num"}
+        item["rank"] = rank
+        result.append(item)
+    return result
+
+async def migrate_user(user: dict[str, Any]) -> bool:
+    """Переводит группы и задачи пользователя с order_num на rank одной записью.
+
+    Запись выполняется, только если группы не изменились с момента чтения.
+    При успехе user["todo"] заменяется новыми данными.
+
+    Args:
+        user (dict[str, Any]): Документ пользователя с полем todo.
+
+    Returns:
+        bool: True, если данные записаны.
+    """
+    todo = [{**group, "tasks": _reranked(group["tasks"])} for group in _reranked(user["todo"])]
+    result = await database.users.update_one(
+        {"_id": user["_id"], "todo": user["todo"]},
+        {"$set": {"todo": todo}, "$inc": {"rev": 1}},
+    )
+    if result.matched_count:
+        user["todo"] = todo
+    return bool(result.matched_count)
+
+async def _rebalance(user_id: ObjectId, group_id: ObjectId | None):
+    """Перенумеровывает группы пользователя или задачи группы короткими ключами.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId | None): Идентификатор группы или None для списка групп.
+    """
+    user = await database.users.find_one({"_id": user_id}, {"todo": 1})
+    if user is None:
+        return
+    if group_id is None:
+        await database.users.update_one(
+            {"_id": user_id, "todo": user["todo"]},
+            {"$set": {"todo": _reranked(user["todo"])}, "$inc": {"rev": 1}},
+        )
+        return
+    for group in user["todo"]:
+        if group["_id"] == group_id:
+            await database.users.update_one(
+                {"_id": user_id, "todo": {"$elemMatch": {"_id": group_id, "tasks": group["tasks"]}}},
+                {"$set": {"todo.$.tasks": _reranked(group["tasks"])}, "$inc": {"rev": 1}},
+            )
+            return
+
+def schedule_rebalance(rank: str, user_id: ObjectId, group_id: ObjectId | None = None):
+    """Запускает фоновую перенумерацию, если выданный ключ слишком длинный.
+
+    Перенумерация выполняется только если список не изменился с момента чтения,
+    иначе она будет запущена при следующем перемещении.
+
+    Args:
+        rank (str): Только что выданный ключ.
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId | None): Идентификатор группы для задач или None для групп.
+    """
+    if len(rank) > MAX_RANK_LENGTH:
+        start_rebalance(user_id, group_id)
+
+def start_rebalance(user_id: ObjectId, group_id: ObjectId | None = None):
+    """Запускает фоновую перенумерацию списка групп или задач группы.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId | None): Идентификатор группы для задач или None для групп.
+    """
+    task = asyncio.create_task(_rebalance(user_id, group_id))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+async def migrate_all():
+    """Переводит всех пользователей с order_num на rank."""
+    database.connect()
+    migrated = 0
+    try:
+        query = {"$or": [
+            {"todo": {"$elemMatch": {"rank": {"$exists": False}}}},
+            {"todo.tasks": {"$elemMatch": {"rank": {"$exists": False}}}},
+        ]}
+        async for user in database.users.find(query, {"todo": 1}):
+            if await migrate_user(user):
+                migrated += 1
+            else:
+                logger.warning("User %s changed during migration, run the command again", user["_id"])
+    finally:
+        await database.disconnect()
+    print(f"Migrated {migrated} users")
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("Usage: python -m app.tasks.ranking migrate")
+    asyncio.run(migrate_all())
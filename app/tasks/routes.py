@@ -1,9 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
 
-from app.auth.dependencies import get_current_user
-from . import models, crud
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
 
-tasks_router = APIRouter(prefix="/task-groups", tags=["tasks"])
+from app.auth.dependencies import get_current_user, get_current_user_id, get_current_username
+from . import models, archive, counters, crud, ranking, search, wire
+from .cache import cache_key, get_render_cache
+from .events import change_feed, format_sse
+
+HEARTBEAT_INTERVAL = 15
+
+task_groups_adapter = TypeAdapter(list[models.GetTaskGroup])
+task_group_adapter = TypeAdapter(models.GetTaskGroup)
+
+def render(adapter: TypeAdapter, data, fmt: str = wire.JSON) -> bytes:
+    """Проверяет данные по модели ответа и сериализует их в JSON или MessagePack.
+
+    Args:
+        adapter (TypeAdapter): Адаптер модели ответа.
+        data: Данные ответа.
+        fmt (str): Формат ответа, ``json`` или ``msgpack``.
+
+    Returns:
+        bytes: Тело ответа.
+    """
+    validated = adapter.validate_python(data)
+    if fmt == wire.MSGPACK:
+        return wire.packb(adapter.dump_python(validated, by_alias=True))
+    return adapter.dump_json(validated, by_alias=True)
+
+tasks_router = APIRouter(prefix="/task-groups", tags=["tasks"], route_class=wire.NegotiatedRoute)
 
 @tasks_router.post("/{group_name}",
                    # response_model=models.TaskGroupCreate
@@ -27,28 +54,122 @@ async def create_group(
 @tasks_router.get("/",
                   response_model=list[models.GetTaskGroup]
                   )
-async def get_task_groups(user=Depends(get_current_user)):
-    """Возвращает все группы задач пользователя.
+async def get_task_groups(request: Request, user=Depends(get_current_user)):
+    """Возвращает все группы задач пользователя. Сериализованный ответ кешируется по ревизии пользователя.
 
     Args:
+        request (Request): Запрос, по заголовку Accept выбирается JSON или MessagePack.
         user (dict): Текущий пользователь.
 
     Returns:
-        list[models.GetTaskGroup]: Список групп задач.
+        list[models.GetTaskGroup]: Список групп задач, упорядоченный по rank.
+    """
+    fmt = wire.response_format(request)
+    body = await get_render_cache().get_or_render(
+        cache_key(user, "task_groups", fmt),
+        lambda: render(task_groups_adapter, crud.ordered_task_groups(user), fmt),
+    )
+    return Response(body, media_type=wire.MEDIA_TYPES[fmt])
+
+@tasks_router.get("/-/events")
+async def stream_events(user=Depends(get_current_user)):
+    """Отправляет изменения групп и задач пользователя через Server-Sent Events.
+
+    События ``update`` содержат измененные поля в формате ``todo.<id группы>.tasks.<id задачи>...``,
+    событие ``resync`` означает, что клиенту нужно заново запросить ``GET /task-groups/``.
+    Пока изменений нет, раз в HEARTBEAT_INTERVAL секунд отправляется комментарий.
+
+    Args:
+        user (dict): Текущий пользователь.
+
+    Returns:
+        StreamingResponse: Поток событий text/event-stream.
+    """
+    async def events():
+        async with change_feed.subscribe(user["_id"]) as queue:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@tasks_router.get("/-/search", response_model=list[models.SearchHit])
+async def search_tasks(
+        q: str = Query(min_length=1),
+        page: int = Query(1, ge=1),
+        size: int = Query(20, ge=1, le=100),
+        user_id=Depends(get_current_user_id)
+):
+    """Ищет группы и задачи пользователя по названиям и описаниям.
+
+    Args:
+        q (str): Поисковый запрос.
+        page (int): Номер страницы, начиная с 1.
+        size (int): Количество результатов на странице.
+        user_id (ObjectId): Идентификатор текущего пользователя.
+
+    Returns:
+        list[models.SearchHit]: Найденные группы и задачи, отсортированные по релевантности.
     """
-    return user["todo"]
+    return await search.search(user_id, q, page, size)
+
+@tasks_router.get("/-/summary", response_model=models.TaskSummary)
+async def get_summary(username=Depends(get_current_username)):
+    """Возвращает количество групп и задач пользователя, не загружая сами задачи.
+
+    Args:
+        username (str): Имя текущего пользователя.
+
+    Returns:
+        models.TaskSummary: Количество групп, задач и задач в каждой группе.
+
+    Raises:
+        HTTPException: Если пользователь не найден.
+    """
+    summary = await counters.get_summary(username)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return summary
+
+@tasks_router.get("/-/archive", response_model=list[models.ArchivedTask])
+async def get_archived_tasks(
+        page: int = Query(1, ge=1),
+        size: int = Query(50, ge=1, le=200),
+        user_id=Depends(get_current_user_id)
+):
+    """Возвращает архивные задачи пользователя, начиная с последних перенесенных.
+
+    Args:
+        page (int): Номер страницы, начиная с 1.
+        size (int): Количество задач на странице.
+        user_id (ObjectId): Идентификатор текущего пользователя.
+
+    Returns:
+        list[models.ArchivedTask]: Архивные задачи.
+    """
+    return await archive.list_archived(user_id, page, size)
 
 @tasks_router.get("/{group_name}",
                   response_model=models.GetTaskGroup
                   )
 async def get_group(
         group_name: str,
+        request: Request,
         user=Depends(get_current_user)
 ):
-    """Возвращает нужную группу задач по ее названию.
+    """Возвращает нужную группу задач по ее названию. Сериализованный ответ кешируется по ревизии пользователя.
 
     Args:
         group_name (str): Название группы задач.
+        request (Request): Запрос, по заголовку Accept выбирается JSON или MessagePack.
         user (dict): Текущий пользователь.
 
     Returns:
@@ -60,7 +181,33 @@ async def get_group(
     group = crud.get_task_group(user, group_name)
     if group is None:
         raise HTTPException(status_code=404, detail="Group not found")
-    return group
+    fmt = wire.response_format(request)
+    body = await get_render_cache().get_or_render(
+        cache_key(user, "task_group", fmt, group_name),
+        lambda: render(task_group_adapter, crud.ordered_task_group(user, group), fmt),
+    )
+    return Response(body, media_type=wire.MEDIA_TYPES[fmt])
+
+@tasks_router.patch("/{group_name}", response_model=dict)
+async def move_group(
+        group_name: str,
+        after: str | None = None,
+        before: str | None = None,
+        user=Depends(get_current_user)
+):
+    """Перемещает группу задач после группы after или перед группой before.
+    Если ни одна не указана, группа перемещается в конец списка.
+
+    Args:
+        group_name (str): Название группы задач.
+        after (str | None): Название группы, после которой нужно поставить группу.
+        before (str | None): Название группы, перед которой нужно поставить группу.
+        user (dict): Текущий пользователь.
+
+    Returns:
+        dict: Результат перемещения группы задач.
+    """
+    return await crud.move_task_group(user, group_name, after, before)
 
 @tasks_router.put("/{group_name}", response_model=dict)
 async def rename_group(group_name: str, new_group_name: str, user=Depends(get_current_user)):
@@ -94,18 +241,28 @@ async def delete_group(
     return result
 
 @tasks_router.post("/{group_name}/{task_name}")
-async def create_task(group_name: str, task_name: str, description: str = "", user=Depends(get_current_user)):
+async def create_task(
+        group_name: str,
+        task_name: str,
+        description: str = "",
+        task: models.TaskCreate | None = Body(None),
+        user=Depends(get_current_user)
+):
     """Создает задачу с названием и описанием в указанной группе задач.
+    Описание можно передать параметром запроса или в теле (JSON или MessagePack).
 
     Args:
         group_name (str): Название группы задач.
         task_name (str): Название задачи.
         description (str): Описание задачи.
+        task (models.TaskCreate | None): Тело запроса с описанием задачи.
         user (dict): Текущий пользователь.
 
     Returns:
         dict: Результат создания задачи.
     """
+    if task is not None:
+        description = task.description
     return await crud.create_task(user, group_name, task_name, description)
 
 @tasks_router.get("/{group_name}/{task_name}", response_model=models.Task)
@@ -129,7 +286,47 @@ def get_task(group_name: str, task_name: str, user=Depends(get_current_user)):
     task = crud.get_task(task_group, task_name)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    return task
+    return {**task, "order_num": ranking.position(task_group["tasks"], task)}
+
+@tasks_router.put("/{group_name}/{task_name}", response_model=dict)
+async def complete_task(group_name: str, task_name: str, completed: bool = True, user=Depends(get_current_user)):
+    """Отмечает задачу выполненной или снимает отметку.
+
+    Args:
+        group_name (str): Название группы задач.
+        task_name (str): Название задачи.
+        completed (bool): Выполнена ли задача.
+        user (dict): Текущий пользователь.
+
+    Returns:
+        dict: Результат изменения задачи.
+    """
+    return await crud.set_task_completed(user, group_name, task_name, completed)
+
+@tasks_router.patch("/{group_name}/{task_name}", response_model=dict)
+async def move_task(
+        group_name: str,
+        task_name: str,
+        to_group: str | None = None,
+        after: str | None = None,
+        before: str | None = None,
+        user=Depends(get_current_user)
+):
+    """Перемещает задачу внутри группы или в другую группу to_group.
+    Задача ставится после задачи after или перед задачей before, иначе в конец группы.
+
+    Args:
+        group_name (str): Название группы задач.
+        task_name (str): Название задачи.
+        to_group (str | None): Название группы, в которую нужно перенести задачу.
+        after (str | None): Название задачи, после которой нужно поставить задачу.
+        before (str | None): Название задачи, перед которой нужно поставить задачу.
+        user (dict): Текущий пользователь.
+
+    Returns:
+        dict: Результат перемещения задачи.
+    """
+    return await crud.move_task(user, group_name, task_name, to_group, after, before)
 
 @tasks_router.delete("/{group_name}/{task_name}")
 async def delete_task(group_name: str, task_name: str, user=Depends(get_current_user)):
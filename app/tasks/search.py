@@ -0,0 +1,159 @@
+"""Полнотекстовый поиск по группам и задачам.
+
+Группы и задачи хранятся внутри документа пользователя, а текстовый индекс MongoDB
+ранжирует документы целиком. Поэтому для поиска ведется отдельная коллекция
+task_search, где каждой группе и задаче соответствует свой документ, а индекс
+начинается с user_id. Документы обновляются функциями crud вместе с пользователем.
+Для заполнения коллекции по уже существующим данным::
+
+    python -m app.tasks.search reindex
+"""
+import asyncio
+import sys
+from typing import Any
+
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne
+
+from app import database
+
+async def index_group(user_id: ObjectId, group_id: ObjectId, title: str):
+    """Добавляет группу задач в поисковый индекс.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId): Идентификатор группы.
+        title (str): Название группы.
+    """
+    await database.task_search.insert_one(group_document(user_id, group_id, title))
+
+async def index_task(user_id: ObjectId, group_id: ObjectId, task: dict[str, Any]):
+    """Добавляет задачу в поисковый индекс.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId): Идентификатор группы задачи.
+        task (dict[str, Any]): Задача.
+    """
+    await database.task_search.insert_one(task_document(user_id, group_id, task))
+
+async def rename_group(group_id: ObjectId, title: str):
+    """Обновляет название группы в поисковом индексе.
+
+    Args:
+        group_id (ObjectId): Идентификатор группы.
+        title (str): Новое название группы.
+    """
+    await database.task_search.update_one({"_id": group_id}, {"$set": {"title": title}})
+
+async def remove_group(group_id: ObjectId):
+    """Удаляет группу и все ее задачи из поискового индекса.
+
+    Args:
+        group_id (ObjectId): Идентификатор группы.
+    """
+    await database.task_search.delete_many({"group_id": group_id})
+
+async def remove_task(task_id: ObjectId):
+    """Удаляет задачу из поискового индекса.
+
+    Args:
+        task_id (ObjectId): Идентификатор задачи.
+    """
+    await database.task_search.delete_one({"_id": task_id})
+
+async def remove_tasks(task_ids: list[ObjectId]):
+    """Удаляет задачи из поискового индекса.
+
+    Args:
+        task_ids (list[ObjectId]): Идентификаторы задач.
+    """
+    await database.task_search.delete_many({"_id": {"$in": task_ids}})
+
+async def move_task(task_id: ObjectId, group_id: ObjectId):
+    """Обновляет группу задачи в поисковом индексе.
+
+    Args:
+        task_id (ObjectId): Идентификатор задачи.
+        group_id (ObjectId): Идентификатор новой группы.
+    """
+    await database.task_search.update_one({"_id": task_id}, {"$set": {"group_id": group_id}})
+
+async def search(user_id: ObjectId, query: str, page: int, size: int) -> list[dict[str, Any]]:
+    """Ищет группы и задачи пользователя по словам запроса.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        query (str): Поисковый запрос в синтаксисе $text.
+        page (int): Номер страницы, начиная с 1.
+        size (int): Количество результатов на странице.
+
+    Returns:
+        list[dict[str, Any]]: Найденные группы и задачи, отсортированные по релевантности.
+    """
+    cursor = database.task_search.find(
+        {"user_id": user_id, "$text": {"$search": query}},
+        {"user_id": 0, "score": {"$meta": "textScore"}},
+    ).sort([("score", {"$meta": "textScore"})]).skip((page - 1) * size).limit(size)
+    return await cursor.to_list(length=size)
+
+def group_document(user_id: ObjectId, group_id: ObjectId, title: str) -> dict[str, Any]:
+    """Возвращает поисковый документ группы задач.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId): Идентификатор группы задач.
+        title (str): Название группы задач.
+
+    Returns:
+        dict[str, Any]: Документ коллекции task_search.
+    """
+    return {"_id": group_id, "user_id": user_id, "kind": "group", "group_id": group_id, "title": title}
+
+def task_document(user_id: ObjectId, group_id: ObjectId, task: dict[str, Any]) -> dict[str, Any]:
+    """Возвращает поисковый документ задачи с тем же _id, что у задачи.
+
+    Args:
+        user_id (ObjectId): Идентификатор пользователя.
+        group_id (ObjectId): Идентификатор группы задач.
+        task (dict[str, Any]): Задача.
+
+    Returns:
+        dict[str, Any]: Документ коллекции task_search.
+    """
+    return {
+        "_id": task["_id"],
+        "user_id": user_id,
+        "kind": "task",
+        "group_id": group_id,
+        "title": task["title"],
+        "description": task.get("description", ""),
+    }
+
+async def reindex_user(user: dict[str, Any]):
+    """Пересоздает поисковые документы пользователя по его группам и задачам.
+
+    Args:
+        user (dict[str, Any]): Документ пользователя.
+    """
+    requests = [DeleteMany({"user_id": user["_id"]})]
+    for group in user.get("todo", []):
+        requests.append(InsertOne(group_document(user["_id"], group["_id"], group["title"])))
+        for task in group["tasks"]:
+            requests.append(InsertOne(task_document(user["_id"], group["_id"], task)))
+    await database.task_search.bulk_write(requests, ordered=True)
+
+async def reindex_all():
+    """Пересоздает поисковые документы всех пользователей."""
+    database.connect()
+    await database.on_init()
+    try:
+        async for user in database.users.find({}, {"todo": 1}):
+            await reindex_user(user)
+    finally:
+        await database.disconnect()
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["reindex"]:
+        sys.exit("Usage: python -m app.tasks.search reindex")
+    asyncio.run(reindex_all())
@@ -0,0 +1,145 @@
+"""Формат MessagePack для маршрутов групп и задач.
+
+Клиент с заголовком ``Accept: application/msgpack`` получает ответы в MessagePack,
+где ObjectId передаются как 12 байт (bin), а не строкой из 24 символов, а даты -
+строками ISO 8601, как в JSON. Если клиент принимает оба формата, выбирается формат
+с большим весом q, при равных весах - JSON. Тело запроса с ``Content-Type: application/msgpack``
+принимается так же, как JSON. Ошибки всегда возвращаются в JSON.
+"""
+import json
+from datetime import datetime
+from typing import Any, Callable
+
+import msgpack
+from bson import ObjectId
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+
+JSON = "json"
+MSGPACK = "msgpack"
+MEDIA_TYPES = {JSON: "application/json", MSGPACK: "application/msgpack"}
+MSGPACK_MEDIA_TYPES = {"application/msgpack", "application/x-msgpack"}
+
+# Диапазоны, которые покрывают JSON, от самого конкретного
+JSON_MEDIA_RANGES = ("application/json", "application/*", "*/*")
+
+def _quality(params: list[str]) -> float:
+    """Возвращает вес q из параметров элемента Accept, по умолчанию 1."""
+    for param in params:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                return 0.0
+            return q if 0 < q <= 1 else 0.0
+    return 1.0
+
+def response_format(request: Request) -> str:
+    """Выбирает формат ответа по весам q в заголовке Accept.
+
+    Вес JSON берется из самого конкретного диапазона (``application/json``,
+    ``application/*`` или ``*/*``), вес MessagePack - из его типов. При равных весах
+    и без заголовка Accept выбирается JSON.
+
+    Args:
+        request (Request): Запрос.
+
+    Returns:
+        str: ``msgpack``, если клиент предпочитает MessagePack, иначе ``json``.
+    """
+    weights = {}
+    for item in request.headers.get("accept", "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        media_type = media_type.lower()
+        weights[media_type] = max(weights.get(media_type, 0.0), _quality(params))
+    json_q = next((weights[media_range] for media_range in JSON_MEDIA_RANGES if media_range in weights), 0.0)
+    msgpack_q = max((weights.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES), default=0.0)
+    return MSGPACK if msgpack_q > json_q else JSON
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return value.binary
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__} to MessagePack")
+
+def packb(data: Any) -> bytes:
+    """Кодирует данные в MessagePack, ObjectId - как 12 байт.
+
+    Args:
+        data (Any): Данные ответа.
+
+    Returns:
+        bytes: Тело ответа.
+    """
+    return msgpack.packb(data, default=_default)
+
+def _ids_from_json(value: Any, key: str | None = None) -> Any:
+    """Заменяет строковые идентификаторы из JSON ответа на ObjectId."""
+    if isinstance(value, dict):
+        return {k: _ids_from_json(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_ids_from_json(item, key) for item in value]
+    if isinstance(value, str) and key is not None and key.endswith("_id") and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value
+
+def _ids_to_json(value: Any, key: str | None = None) -> Any:
+    """Заменяет 12-байтовые идентификаторы из MessagePack на строки для валидации моделей."""
+    if isinstance(value, dict):
+        return {k: _ids_to_json(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_ids_to_json(item, key) for item in value]
+    if isinstance(value, bytes) and key is not None and key.endswith("_id") and len(value) == 12:
+        return str(ObjectId(value))
+    return value
+
+class NegotiatedRoute(APIRoute):
+    """Маршрут, принимающий и возвращающий MessagePack по заголовкам запроса.
+
+    Тело в MessagePack перекодируется в JSON до разбора параметров FastAPI.
+    JSON ответ перекодируется в MessagePack, если клиент его принимает;
+    маршруты, которые сами сериализуют ответ в нужном формате, не перекодируются.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            content_type = request.headers.get("content-type", "").split(";")[0].strip()
+            if content_type in MSGPACK_MEDIA_TYPES:
+                request = await _as_json_request(request)
+
+            response = await handler(request)
+            if response.media_type == MEDIA_TYPES[JSON] and response_format(request) == MSGPACK:
+                response = Response(
+                    packb(_ids_from_json(json.loads(response.body))),
+                    status_code=response.status_code,
+                    headers={k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")},
+                    media_type=MEDIA_TYPES[MSGPACK],
+                )
+            if response.media_type in (MEDIA_TYPES[JSON], MEDIA_TYPES[MSGPACK]):
+                response.headers.append("vary", "Accept")
+            return response
+
+        return route_handler
+
+async def _as_json_request(request: Request) -> Request:
+    """Возвращает копию запроса, где тело MessagePack заменено эквивалентным JSON.
+
+    Raises:
+        HTTPException: Если тело не является MessagePack или содержит значения, которых нет в JSON.
+    """
+    body = await request.body()
+    try:
+        json_body = json.dumps(_ids_to_json(msgpack.unpackb(body)), allow_nan=False).encode() if body else b""
+    except (msgpack.UnpackException, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid MessagePack body")
+    scope = dict(request.scope)
+    scope["headers"] = [
+        (name, value) for name, value in scope["headers"] if name not in (b"content-type", b"content-length")
+    ] + [(b"content-type", MEDIA_TYPES[JSON].encode())]
+    json_request = Request(scope, request.receive)
+    json_request._body = json_body
+    return json_request
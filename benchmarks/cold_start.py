@@ -0,0 +1,133 @@
+"""Бенчмарк холодного старта: время импорта ``app.main`` и запуска lifespan.
+
+Каждый замер выполняется в новом интерпретаторе, поэтому учитывается вся
+работа при импорте модулей. Время запуска самого интерпретатора вычитается.
+
+Пример::
+
+    python -m benchmarks.cold_start --backend mongomock --runs 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import save_results
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    """Запускает новый интерпретатор Python из корня репозитория.
+
+    Args:
+        *args (str): Аргументы интерпретатора.
+
+    Returns:
+        subprocess.CompletedProcess: Результат выполнения.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run([sys.executable, *args], cwd=root, capture_output=True, text=True, check=True)
+
+def wall_time(*args: str) -> float:
+    """Замеряет полное время выполнения интерпретатора.
+
+    Args:
+        *args (str): Аргументы интерпретатора.
+
+    Returns:
+        float: Время в секундах.
+    """
+    start = time.perf_counter()
+    run_python(*args)
+    return time.perf_counter() - start
+
+def slowest_imports(limit: int) -> list[dict]:
+    """Возвращает модули с наибольшим собственным временем импорта по данным ``-X importtime``.
+
+    Args:
+        limit (int): Количество модулей.
+
+    Returns:
+        list[dict]: Модули и их собственное и накопленное время импорта в миллисекундах.
+    """
+    stderr = run_python("-X", "importtime", "-c", "import app.main").stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:limit]
+
+async def boot(backend: str) -> dict:
+    """Выполняет запуск и остановку lifespan приложения. Выполняется в дочернем процессе.
+
+    Args:
+        backend (str): ``mongo`` или ``mongomock``.
+
+    Returns:
+        dict: Время запуска и остановки в секундах.
+    """
+    from benchmarks.common import use_backend
+
+    use_backend(backend)
+    from app.main import app
+
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+    stopped = time.perf_counter()
+    return {
+        "startup_s": started - start,
+        "shutdown_s": stopped - started,
+    }
+
+def median_ms(values: list[float]) -> float:
+    return round(statistics.median(values) * 1000, 3)
+
+def main(args):
+    interpreter = [wall_time("-c", "pass") for _ in range(args.runs)]
+    import_only = [wall_time("-c", "import app.main") for _ in range(args.runs)]
+    boots = [
+        json.loads(run_python("-m", "benchmarks.cold_start", "--child", "--backend", args.backend).stdout)
+        for _ in range(args.runs)
+    ]
+
+    results = {
+        "import app.main": {
+            "median_ms": round(median_ms(import_only) - median_ms(interpreter), 3),
+            "interpreter_ms": median_ms(interpreter),
+        },
+        "lifespan": {
+            "startup_ms": median_ms([b["startup_s"] for b in boots]),
+            "shutdown_ms": median_ms([b["shutdown_s"] for b in boots]),
+        },
+        "slowest_imports": slowest_imports(args.top),
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    path = save_results("cold_start", {k: v for k, v in vars(args).items() if k not in ("output", "child")},
+                        results, args.output)
+    print(f"Saved to {path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("mongo", "mongomock"), default="mongo")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="сколько самых медленных импортов показать")
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.child:
+        print(json.dumps(asyncio.run(boot(arguments.backend))))
+    else:
+        main(arguments)
@@ -0,0 +1,177 @@
+"""Общие функции бенчмарков: окружение, наполнение базы и сохранение результатов."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+from datetime import datetime, UTC
+from pathlib import Path
+
+from bson import ObjectId
+
+RESULTS_DIR = Path(__file__).parent / "results"
+USERNAME_PREFIX = "bench-"
+PASSWORD = "bench-password"
+
+def prepare_env():
+    """Заполняет переменные окружения, без которых приложение не запускается."""
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("MAIL", "bench@example.com")
+    os.environ.setdefault("MAIL_PASSWORD", "bench")
+    os.environ.setdefault("SMTP_SERVER", "localhost")
+    # Иначе бенчмарк одновременных входов замеряет ответы 503 ограничителя, а не bcrypt
+    os.environ.setdefault("LOAD_SHEDDING", "0")
+
+def use_backend(backend: str):
+    """Подключает приложение к выбранной базе данных.
+
+    ``mongo`` использует локальный mongod из MONGO_URI (по умолчанию
+    mongodb://localhost:27017), ``mongomock`` - mongomock-motor в памяти.
+    mongomock не поддерживает позиционный оператор ``$`` в ``$push``,
+    поэтому создание задач на нем завершается ошибкой.
+
+    Args:
+        backend (str): ``mongo`` или ``mongomock``.
+
+    Returns:
+        Коллекция пользователей, с которой работает приложение.
+    """
+    prepare_env()
+    if backend == "mongo":
+        os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+    from app import database
+
+    if backend == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+
+        database.client = AsyncMongoMockClient()
+    database.connect()
+    return database.users
+
+def make_todo(groups: int, tasks: int) -> list[dict]:
+    """Создает список групп задач для документа пользователя.
+
+    Args:
+        groups (int): Количество групп.
+        tasks (int): Количество задач в каждой группе.
+
+    Returns:
+        list[dict]: Группы задач в формате БД.
+    """
+    from app.tasks.ranking import spread_ranks
+
+    group_ranks, task_ranks = spread_ranks(groups), spread_ranks(tasks)
+    return [
+        {
+            "_id": ObjectId(),
+            "title": f"group-{g}",
+            "rank": group_ranks[g],
+            "task_count": tasks,
+            "tasks": [
+                {
+                    "_id": ObjectId(),
+                    "title": f"task-{t}",
+                    "description": f"Описание задачи {t} в группе {g}",
+                    "rank": task_ranks[t],
+                }
+                for t in range(tasks)
+            ],
+        }
+        for g in range(groups)
+    ]
+
+async def seed_users(users, count: int, groups: int, tasks: int) -> list[str]:
+    """Пересоздает пользователей бенчмарка с заданным количеством групп и задач.
+
+    Удаляются только пользователи с префиксом ``bench-``.
+
+    Args:
+        users: Коллекция пользователей.
+        count (int): Количество пользователей.
+        groups (int): Количество групп у каждого пользователя.
+        tasks (int): Количество задач в каждой группе.
+
+    Returns:
+        list[str]: Имена созданных пользователей.
+    """
+    from app.auth.services import get_password_hash
+    from app.database import COUNTERS_VERSION
+
+    await users.delete_many({"username": {"$regex": f"^{USERNAME_PREFIX}"}})
+    hashed_password = get_password_hash(PASSWORD)
+    usernames = [f"{USERNAME_PREFIX}{i}" for i in range(count)]
+    await users.insert_many([
+        {
+            "username": username,
+            "email": f"{username}@example.com",
+            "hashed_password": hashed_password,
+            "is_active": True,
+            "group_count": groups,
+            "task_count": groups * tasks,
+            "counters_version": COUNTERS_VERSION,
+            "todo": make_todo(groups, tasks),
+        }
+        for username in usernames
+    ])
+    return usernames
+
+def summarize(latencies: list[float], elapsed: float, errors: int) -> dict:
+    """Считает перцентили задержки и пропускную способность.
+
+    Args:
+        latencies (list[float]): Время выполнения запросов в секундах.
+        elapsed (float): Общее время прогона в секундах.
+        errors (int): Количество неуспешных ответов.
+
+    Returns:
+        dict: p50/p99 в миллисекундах, запросы в секунду и число ошибок.
+    """
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+def git_revision() -> str:
+    """Возвращает короткий хеш текущего коммита.
+
+    Returns:
+        str: Хеш коммита или ``unknown`` вне git репозитория.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(kind: str, params: dict, results: dict, output: str | None = None) -> Path:
+    """Сохраняет результаты бенчмарка в JSON.
+
+    Args:
+        kind (str): Название бенчмарка, например ``load`` или ``micro``.
+        params (dict): Параметры прогона.
+        results (dict): Результаты по сценариям.
+        output (str | None): Путь к файлу. По умолчанию ``results/<kind>-<commit>.json``.
+
+    Returns:
+        Path: Путь к сохраненному файлу.
+    """
+    revision = git_revision()
+    path = Path(output) if output else RESULTS_DIR / f"{kind}-{revision}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        "kind": kind,
+        "commit": revision,
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }, indent=2, ensure_ascii=False))
+    return path
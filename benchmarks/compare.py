@@ -0,0 +1,64 @@
+"""Сравнение двух JSON файлов с результатами бенчмарков.
+
+Пример::
+
+    python -m benchmarks.compare benchmarks/results/load-abc123.json benchmarks/results/load-def456.json
+
+Возвращает код 1, если какая-либо метрика ухудшилась больше порога.
+"""
+import argparse
+import json
+import sys
+
+# Для этих метрик больше - лучше, для остальных - хуже
+HIGHER_IS_BETTER = {"rps"}
+COMPARED_METRICS = {"p50_ms", "p99_ms", "rps", "best_us", "median_us", "median_ms", "startup_ms"}
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Печатает изменения метрик и возвращает список ухудшений.
+
+    Args:
+        baseline (dict): Результаты базового прогона.
+        current (dict): Результаты нового прогона.
+        threshold (float): Допустимое ухудшение в процентах.
+
+    Returns:
+        list[str]: Описания метрик, ухудшившихся больше порога.
+    """
+    regressions = []
+    for name, metrics in current["results"].items():
+        base_metrics = baseline["results"].get(name)
+        if not isinstance(metrics, dict) or base_metrics is None:
+            continue
+        for metric in sorted(COMPARED_METRICS & metrics.keys()):
+            old, new = base_metrics[metric], metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            mark = "REGRESSION" if worse > threshold else ""
+            print(f"{name:50} {metric:10} {old:>12} -> {new:>12} {change:+7.1f}% {mark}")
+            if mark:
+                regressions.append(f"{name} {metric}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="допустимое ухудшение в процентах")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"{baseline['commit']} -> {current['commit']}")
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold}%")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Нагрузочный бенчмарк маршрутов авторизации и задач.
+
+Приложение ``app.main:app`` запускается в том же процессе через ASGI транспорт
+httpx, поэтому в замеры не попадает сетевой стек, только код приложения и база.
+
+Пример::
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.load --users 20 --groups 50 --tasks 100
+    python -m benchmarks.load --backend mongomock
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.common import PASSWORD, save_results, seed_users, summarize, use_backend
+
+class Recorder:
+    """Собирает время выполнения запросов по шаблонам маршрутов."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        """Выполняет запрос и записывает его время под именем endpoint.
+
+        Args:
+            client (httpx.AsyncClient): Клиент приложения.
+            endpoint (str): Шаблон маршрута для отчета.
+            method (str): HTTP метод.
+            url (str): Фактический URL.
+            **kwargs: Параметры запроса httpx.
+        """
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+
+async def login(recorder, client, user, rng, args):
+    await recorder.request(client, "POST /auth/token", "POST", "/auth/token",
+                           data={"username": user["username"], "password": PASSWORD})
+
+async def read_me(recorder, client, user, rng, args):
+    await recorder.request(client, "GET /users/me", "GET", "/users/me", headers=user["headers"])
+
+async def list_groups(recorder, client, user, rng, args):
+    await recorder.request(client, "GET /task-groups/", "GET", "/task-groups/", headers=user["headers"])
+
+async def read_group(recorder, client, user, rng, args):
+    group = f"group-{rng.randrange(args.groups)}"
+    await recorder.request(client, "GET /task-groups/{group_name}", "GET", f"/task-groups/{group}",
+                           headers=user["headers"])
+
+async def read_task(recorder, client, user, rng, args):
+    group = f"group-{rng.randrange(args.groups)}"
+    task = f"task-{rng.randrange(args.tasks)}"
+    await recorder.request(client, "GET /task-groups/{group_name}/{task_name}", "GET",
+                           f"/task-groups/{group}/{task}", headers=user["headers"])
+
+async def create_delete_group(recorder, client, user, rng, args):
+    group = f"bench-group-{rng.getrandbits(48):x}"
+    await recorder.request(client, "POST /task-groups/{group_name}", "POST", f"/task-groups/{group}",
+                           headers=user["headers"])
+    await recorder.request(client, "DELETE /task-groups/{group_name}", "DELETE", f"/task-groups/{group}",
+                           headers=user["headers"])
+
+async def create_delete_task(recorder, client, user, rng, args):
+    group = f"group-{rng.randrange(args.groups)}"
+    task = f"bench-task-{rng.getrandbits(48):x}"
+    await recorder.request(client, "POST /task-groups/{group_name}/{task_name}", "POST",
+                           f"/task-groups/{group}/{task}", headers=user["headers"])
+    await recorder.request(client, "DELETE /task-groups/{group_name}/{task_name}", "DELETE",
+                           f"/task-groups/{group}/{task}", headers=user["headers"])
+
+SCENARIOS = {
+    "login": login,
+    "me": read_me,
+    "list_groups": list_groups,
+    "read_group": read_group,
+    "read_task": read_task,
+    "create_delete_group": create_delete_group,
+    "create_delete_task": create_delete_task,
+}
+# bcrypt делает вход на порядки дороже остальных запросов
+SLOW_SCENARIOS = {"login"}
+
+async def run_scenario(scenario, client, users, args, requests: int, seed: int) -> Recorder:
+    """Выполняет сценарий requests раз с заданной конкурентностью.
+
+    Args:
+        scenario: Корутина сценария.
+        client (httpx.AsyncClient): Клиент приложения.
+        users (list[dict]): Пользователи бенчмарка с заголовками авторизации.
+        args (argparse.Namespace): Параметры запуска.
+        requests (int): Количество выполнений сценария.
+        seed (int): Начальное значение генераторов случайных чисел воркеров.
+
+    Returns:
+        Recorder: Замеры сценария.
+    """
+    recorder = Recorder()
+    remaining = iter(range(requests))
+
+    async def worker(seed: int):
+        rng = random.Random(seed)
+        for _ in remaining:
+            await scenario(recorder, client, rng.choice(users), rng, args)
+
+    await asyncio.gather(*(worker(seed + i) for i in range(args.concurrency)))
+    return recorder
+
+async def main(args):
+    os.environ["LOAD_SHEDDING"] = "1" if args.load_shedding else "0"
+    users_collection = use_backend(args.backend)
+
+    from app.auth.services import create_access_token
+    from app.main import app
+
+    usernames = await seed_users(users_collection, args.users, args.groups, args.tasks)
+    users = [
+        {"username": name, "headers": {"Authorization": f"Bearer {create_access_token({'sub': name})}"}}
+        for name in usernames
+    ]
+
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in args.scenarios:
+            requests = args.requests // 10 if name in SLOW_SCENARIOS else args.requests
+            # прогрев с другим seed, чтобы не создавать группы и задачи с теми же названиями
+            await run_scenario(SCENARIOS[name], client, users, args, max(1, requests // 10), ~args.seed)
+            start = time.perf_counter()
+            recorder = await run_scenario(SCENARIOS[name], client, users, args, requests, args.seed)
+            elapsed = time.perf_counter() - start
+            for endpoint, latencies in recorder.latencies.items():
+                results[endpoint] = summarize(latencies, elapsed, recorder.errors[endpoint])
+                print(f"{endpoint:50} {results[endpoint]}")
+
+    path = save_results("load", {k: v for k, v in vars(args).items() if k != "output"}, results, args.output)
+    print(f"Saved to {path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("mongo", "mongomock"), default="mongo")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="выполнений каждого сценария")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--load-shedding", action="store_true", help="включить ограничение параллельных запросов")
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,75 @@
+"""Микробенчмарки горячих функций без базы данных.
+
+Пример::
+
+    python -m benchmarks.micro --groups 50 --tasks 200
+"""
+import argparse
+import timeit
+
+from benchmarks.common import make_todo, prepare_env, save_results
+
+def measure(func, repeat: int) -> dict:
+    """Замеряет среднее время одного вызова func.
+
+    Args:
+        func: Функция без аргументов.
+        repeat (int): Количество повторов замера, берется лучший.
+
+    Returns:
+        dict: Лучшее и медианное время одного вызова в микросекундах.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = sorted(t / number for t in timer.repeat(repeat=repeat, number=number))
+    return {
+        "calls_per_run": number,
+        "best_us": round(runs[0] * 1e6, 3),
+        "median_us": round(runs[len(runs) // 2] * 1e6, 3),
+    }
+
+def main(args):
+    prepare_env()
+
+    from pydantic import TypeAdapter
+
+    from app.auth.services import create_access_token, decode_token
+    from app.tasks.crud import get_task_group, ordered_task_groups
+    from app.tasks.models import GetTaskGroup
+
+    user = {"username": "bench", "todo": make_todo(args.groups, args.tasks)}
+    groups = ordered_task_groups(user)
+    last_group = f"group-{args.groups - 1}"
+    token = create_access_token({"sub": "bench"})
+    groups_adapter = TypeAdapter(list[GetTaskGroup])
+
+    benchmarks = {
+        "get_task_group": lambda: get_task_group(user, last_group),
+        "decode_token": lambda: decode_token(token),
+        # так же, как FastAPI обрабатывает response_model: валидация и сериализация в JSON
+        "GetTaskGroup serialization (one group)": lambda: GetTaskGroup.model_validate(
+            groups[-1]
+        ).model_dump_json(by_alias=True),
+        "GetTaskGroup serialization (all groups)": lambda: groups_adapter.dump_json(
+            groups_adapter.validate_python(groups), by_alias=True
+        ),
+    }
+
+    results = {}
+    for name, func in benchmarks.items():
+        results[name] = measure(func, args.repeat)
+        print(f"{name:45} {results[name]}")
+
+    path = save_results("micro", {k: v for k, v in vars(args).items() if k != "output"}, results, args.output)
+    print(f"Saved to {path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
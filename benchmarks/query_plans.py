@@ -0,0 +1,281 @@
+"""Проверка планов запросов слоя данных.
+
+Скрипт наполняет локальную MongoDB пользователями бенчмарка, вызывает функции
+``app.database``, ``app.tasks.crud`` и других модулей, записывая все запросы,
+которые они отправляют, и выполняет для каждой формы запроса ``explain`` с
+executionStats. Проверка не проходит, если в плане есть COLLSCAN или запрос
+просматривает намного больше документов, чем возвращает. Для таких запросов
+печатается предлагаемый индекс.
+
+Данные изменяются только у пользователей бенчмарка (``bench-*``): архиватор
+вызывается для одного из них, а запрос поиска кандидатов на архивацию по всей
+коллекции только читается.
+
+Пример::
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.query_plans --users 200
+
+Возвращает код 1, если найден хотя бы один плохой план.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+from datetime import datetime, UTC
+
+from pymongo import AsyncMongoClient, monitoring
+
+from benchmarks.common import PASSWORD, prepare_env, seed_users, use_backend
+
+QUERY_COMMANDS = {"find", "update", "delete", "findAndModify", "aggregate", "count"}
+# Служебные поля драйвера, которые нельзя передавать внутрь explain
+META_FIELDS = {
+    "$db", "lsid", "$clusterTime", "txnNumber", "$readPreference", "apiVersion", "apiStrict",
+    "apiDeprecationErrors", "autocommit", "startTransaction", "readConcern", "writeConcern",
+}
+RANGE_OPERATORS = {"$lt", "$lte", "$gt", "$gte", "$ne", "$nin", "$exists", "$regex"}
+
+class CommandRecorder(monitoring.CommandListener):
+    """Слушатель команд pymongo, запоминающий запросы, пока включена запись."""
+
+    def __init__(self):
+        self.recording = False
+        self.commands: list[dict] = []
+
+    def started(self, event):
+        if self.recording and event.command_name in QUERY_COMMANDS:
+            self.commands.append(copy.deepcopy(dict(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def query_of(command: dict) -> tuple[str, str, dict, dict]:
+    """Извлекает из команды коллекцию, фильтр и сортировку.
+
+    Args:
+        command (dict): Команда MongoDB.
+
+    Returns:
+        tuple[str, str, dict, dict]: Название команды, коллекция, фильтр и сортировка.
+    """
+    name = next(iter(command))
+    collection = command[name]
+    if name == "find":
+        return name, collection, command.get("filter", {}), command.get("sort", {})
+    if name == "update":
+        return name, collection, command["updates"][0]["q"], {}
+    if name == "delete":
+        return name, collection, command["deletes"][0]["q"], {}
+    if name == "findAndModify":
+        return name, collection, command.get("query", {}), command.get("sort", {})
+    if name == "aggregate":
+        stages = command.get("pipeline", [])
+        match = stages[0].get("$match", {}) if stages else {}
+        return name, collection, match, {}
+    return name, collection, command.get("query", {}), {}
+
+def shape(value):
+    """Заменяет значения в фильтре их типами, чтобы одинаковые запросы считались одной формой.
+
+    Args:
+        value: Фильтр или его часть.
+
+    Returns:
+        Форма значения.
+    """
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    return type(value).__name__
+
+def plan_stages(plan) -> list[str]:
+    """Собирает названия всех стадий плана запроса.
+
+    Args:
+        plan: winningPlan из explain или его часть.
+
+    Returns:
+        list[str]: Названия стадий.
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+def suggest_index(query: dict, sort: dict, prefix: str = "") -> list[dict]:
+    """Предлагает индекс по правилу ESR: сначала поля равенства, затем сортировка, затем диапазоны.
+
+    Args:
+        query (dict): Фильтр запроса.
+        sort (dict): Сортировка запроса.
+        prefix (str): Префикс пути для условий внутри $elemMatch.
+
+    Returns:
+        list[dict]: Ключи индексов; для $or - по индексу на каждую ветку.
+    """
+    if "$or" in query:
+        return [index for branch in query["$or"] for index in suggest_index(branch, sort, prefix)]
+
+    equality, ranges = [], []
+    for field, condition in query.items():
+        if field.startswith("$"):
+            continue
+        path = f"{prefix}{field}"
+        if isinstance(condition, dict) and "$elemMatch" in condition:
+            for index in suggest_index(condition["$elemMatch"], {}, f"{path}."):
+                equality.extend(index.keys())
+        elif isinstance(condition, dict) and RANGE_OPERATORS & condition.keys():
+            ranges.append(path)
+        else:
+            equality.append(path)
+    index = dict.fromkeys(equality, 1)
+    for field, direction in sort.items():
+        index.setdefault(field, direction)
+    for field in ranges:
+        index.setdefault(field, 1)
+    return [index] if index else []
+
+def problems_of(explain: dict, max_ratio: float) -> list[str]:
+    """Проверяет результат explain.
+
+    Args:
+        explain (dict): Результат explain с executionStats.
+        max_ratio (float): Допустимое отношение просмотренных документов к возвращенным.
+
+    Returns:
+        list[str]: Описания проблем плана.
+    """
+    problems = []
+    stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+    if "COLLSCAN" in stages:
+        problems.append("COLLSCAN")
+    stats = explain.get("executionStats", {})
+    examined, returned = stats.get("totalDocsExamined", 0), max(stats.get("nReturned", 0), 1)
+    if examined > max_ratio * returned:
+        problems.append(f"examined {examined} documents for {stats.get('nReturned', 0)} returned")
+    return problems
+
+async def exercise(username: str):
+    """Вызывает функции слоя данных, выполняя все формы запросов приложения.
+
+    Args:
+        username (str): Имя одного из пользователей бенчмарка.
+    """
+    from app import database
+    from app.auth.services import get_password_hash
+    from app.config import get_settings
+    from app.tasks import archive, counters, crud, ranking, search
+
+    async def reload():
+        return await database.users.find_one({"_id": user["_id"]})
+
+    user = await database.get_user_by_username(username)
+    await database.get_user_by_username(username, {"_id": 1})
+    await database.get_user_by_email(user["email"])
+
+    await crud.create_task_group(user, "plans-group")
+    user = await reload()
+    await crud.create_task(user, "plans-group", "plans-task", "plans description")
+    user = await reload()
+    await crud.set_task_completed(user, "plans-group", "plans-task", True)
+    user = await reload()
+    await crud.move_task(user, "plans-group", "plans-task", to_group="group-0")
+    user = await reload()
+    await crud.move_task(user, "group-0", "plans-task", before="task-0")
+    user = await reload()
+    await crud.move_task_group(user, "plans-group", before="group-0")
+    user = await reload()
+    await crud.rename_task_group(user, "plans-group", "plans-group-renamed")
+    user = await reload()
+    await crud.delete_task(user, "group-0", "plans-task")
+    user = await reload()
+    await crud.delete_task_group(user, "plans-group-renamed")
+
+    await counters.get_summary(username)
+    await counters.recount_user(user["_id"])
+    await search.search(user["_id"], "task", 1, 20)
+    await archive.list_archived(user["_id"], 1, 20)
+    # Без ARCHIVE_STALE_DAYS в запросе архиватора нет ветки $or по todo.tasks._id.
+    # archive_once изменил бы всех подходящих пользователей базы, поэтому его запрос только читается
+    now = datetime.now(UTC)
+    for settings in (get_settings().model_copy(update={"archive_stale_days": None}), get_settings()):
+        query, completed_before, created_before = archive.archive_query(settings, now)
+        await database.users.find(query, {"todo": 1}).limit(settings.archive_batch_size).to_list()
+        await archive.archive_user(await reload(), now, completed_before, created_before)
+    await ranking._rebalance(user["_id"], None)
+
+    await database.set_reset_jti(user["email"], "plans-jti")
+    await database.update_password(user["email"], "plans-jti", get_password_hash(PASSWORD))
+    await database.activate_user(user["email"], "plans-jti")
+
+async def run(args) -> int:
+    # Проверяются обе формы запроса архиватора, а индекс старых задач создается только при этой настройке
+    os.environ.setdefault("ARCHIVE_STALE_DAYS", "3650")
+    prepare_env()
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+    from app import database
+    from app.tasks import search
+
+    recorder = CommandRecorder()
+    database.client = AsyncMongoClient(os.environ["MONGO_URI"], event_listeners=[recorder])
+    users = use_backend("mongo")
+    await database.on_init()
+    usernames = await seed_users(users, args.users, args.groups, args.tasks)
+    await search.reindex_user(await database.get_user_by_username(usernames[0]))
+
+    recorder.recording = True
+    try:
+        await exercise(usernames[0])
+    finally:
+        recorder.recording = False
+
+    failures, seen = 0, set()
+    for command in recorder.commands:
+        name, collection, query, sort = query_of(command)
+        key = json.dumps([name, collection, shape(query), shape(sort)], sort_keys=True)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        explain = await database.db.command({
+            "explain": {k: v for k, v in command.items() if k not in META_FIELDS},
+            "verbosity": "executionStats",
+        })
+        problems = problems_of(explain, args.max_ratio)
+        print(f"{'FAIL' if problems else 'ok':4} {collection}.{name} {json.dumps(shape(query), ensure_ascii=False)}")
+        if problems:
+            failures += 1
+            print(f"     {'; '.join(problems)}")
+            for index in suggest_index(query, sort):
+                print(f"     suggested: db.{collection}.createIndex({json.dumps(index)})")
+
+    await database.disconnect()
+    print(f"{len(seen)} query shapes checked, {failures} with bad plans")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--max-ratio", type=float, default=10.0,
+                        help="допустимое отношение просмотренных документов к возвращенным")
+    args = parser.parse_args()
+    if asyncio.run(run(args)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
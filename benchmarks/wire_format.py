@@ -0,0 +1,57 @@
+"""Сравнение JSON и MessagePack для ответа GET /task-groups/ на больших деревьях задач.
+
+Для каждого размера дерева замеряются размер тела и время кодирования
+(проверка по модели и сериализация, как в обработчике) и декодирования.
+
+Пример::
+
+    python -m benchmarks.wire_format --sizes 20x50 100x200
+"""
+import argparse
+import json
+
+from benchmarks.common import make_todo, prepare_env, save_results
+from benchmarks.micro import measure
+
+def main(args):
+    prepare_env()
+
+    import msgpack
+    from bson import ObjectId
+
+    from app.tasks import wire
+    from app.tasks.crud import ordered_task_groups
+    from app.tasks.routes import render, task_groups_adapter
+
+    results = {}
+    for size in args.sizes:
+        groups_count, tasks_count = (int(n) for n in size.split("x"))
+        groups = ordered_task_groups({"_id": ObjectId(), "todo": make_todo(groups_count, tasks_count)})
+        json_body = render(task_groups_adapter, groups, wire.JSON)
+        msgpack_body = render(task_groups_adapter, groups, wire.MSGPACK)
+        print(f"{size}: json {len(json_body)} B, msgpack {len(msgpack_body)} B "
+              f"({len(msgpack_body) / len(json_body):.0%})")
+
+        benchmarks = {
+            "json encode": (lambda: render(task_groups_adapter, groups, wire.JSON), len(json_body)),
+            "msgpack encode": (lambda: render(task_groups_adapter, groups, wire.MSGPACK), len(msgpack_body)),
+            "json decode": (lambda: json.loads(json_body), len(json_body)),
+            "msgpack decode": (lambda: msgpack.unpackb(msgpack_body), len(msgpack_body)),
+        }
+        for name, (func, body_size) in benchmarks.items():
+            key = f"{name} ({size})"
+            results[key] = {"bytes": body_size, **measure(func, args.repeat)}
+            print(f"  {name:20} {results[key]}")
+
+    path = save_results("wire_format", {k: v for k, v in vars(args).items() if k != "output"}, results, args.output)
+    print(f"Saved to {path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["20x50", "100x200"], help="группы x задачи в группе")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())